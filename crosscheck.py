@@ -0,0 +1,343 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""This file contains the harness to cross-check other subdivision paths against the reference.
+
+The reference is ``subdivision.subdivision`` applied level by level. Random valid quad
+meshes (open grids and stars, closed boxes, with irregular valences) are subdivided by
+both the reference and a candidate path. Coordinates are compared within a tolerance,
+connectivity is compared up to renumbering, since a candidate may number nodes, edges
+and faces differently: candidate nodes are matched to reference nodes by position.
+
+To use:
+	`crosscheck.py -c <candidate> -n <number of meshes> -l <levels> -s <seed> -t <tolerance>`
+	Candidates are listed by `crosscheck.py -h`.
+
+@author: Ge_Yin
+"""
+
+import sys, getopt, time, random, math
+
+import geometry as geo
+from subdivision import subdivision, patch_subdivision
+
+def reference_path(mesh, levels):
+	for step in range(levels): subdivision(mesh)
+	return mesh
+
+def reorder_path(mesh, levels):
+	for step in range(levels):
+		subdivision(mesh)
+		geo.reorder_mesh(mesh, 'rcm')
+	return mesh
+
+def patch_path(mesh, levels):
+	patches = geo.PatchMesh(mesh)
+	for step in range(levels): patch_subdivision(patches)
+	return patches.to_mesh()
+
+#: candidate paths, each is called as path(mesh, levels) and gives the subdivided Mesh
+CANDIDATES = {'reorder': reorder_path, 'patch': patch_path}
+
+
+def random_grid(rand, jitter = 0.1):
+	"""Function to generate an open nx*ny grid of quads.
+
+	Args:
+		rand: random.Random object,
+		jitter: float, the random displacement of nodes relative to the grid spacing.
+
+	Returns:
+		coor: list of coordinates, face_list: list of nodes on faces."""
+
+	nx, ny = (rand.randint(1, 5), rand.randint(1, 5))
+	coor = []
+	for j in range(ny + 1):
+		for i in range(nx + 1):
+			coor.append((i + rand.uniform(-jitter, jitter), j + rand.uniform(-jitter, jitter), \
+				rand.uniform(-jitter, jitter)))
+
+	face_list = []
+	for j in range(ny):
+		for i in range(nx):
+			node0 = j*(nx + 1) + i
+			face_list.append((node0, node0 + 1, node0 + nx + 2, node0 + nx + 1))
+
+	return (coor, face_list)
+
+def random_star(rand, jitter = 0.1):
+	"""Function to generate an open star of k*k grids around a node of valence 3 to 7.
+
+	Half of the stars are cut open, so the centre becomes a boundary node of irregular valence.
+
+	Args:
+		rand: random.Random object,
+		jitter: float, the random displacement of nodes relative to the grid spacing.
+
+	Returns:
+		coor: list of coordinates, face_list: list of nodes on faces."""
+
+	n_ray = rand.randint(3, 7)
+	if rand.random() < 0.5: n_sector = n_ray
+	else: n_sector = rand.randint(2, n_ray - 1)
+	k = rand.randint(1, 3)
+
+	direction = [(math.cos(2*math.pi*ray/n_ray), math.sin(2*math.pi*ray/n_ray)) for ray in range(n_ray)]
+
+	coor = []
+	node_of_key = {}
+	def find_node(sector, p, q):
+		#: nodes on the rays between two sectors are shared by both
+		if (p == 0) & (q == 0): key = ('centre',)
+		elif q == 0: key = ('ray', sector, p)
+		elif p == 0: key = ('ray', (sector + 1)%n_ray, q)
+		else: key = ('sector', sector, p, q)
+
+		if key not in node_of_key:
+			d0 = direction[sector]
+			d1 = direction[(sector + 1)%n_ray]
+			node_of_key[key] = len(coor)
+			coor.append((p*d0[0] + q*d1[0] + rand.uniform(-jitter, jitter), \
+				p*d0[1] + q*d1[1] + rand.uniform(-jitter, jitter), rand.uniform(-jitter, jitter)))
+		return node_of_key[key]
+
+	face_list = []
+	for sector in range(n_sector):
+		for p in range(k):
+			for q in range(k):
+				face_list.append((find_node(sector, p, q), find_node(sector, p + 1, q), \
+					find_node(sector, p + 1, q + 1), find_node(sector, p, q + 1)))
+
+	return (coor, face_list)
+
+def random_box(rand, jitter = 0.1):
+	"""Function to generate the closed surface of a nx*ny*nz box, corners have valence 3.
+
+	Args:
+		rand: random.Random object,
+		jitter: float, the random displacement of nodes relative to the grid spacing.
+
+	Returns:
+		coor: list of coordinates, face_list: list of nodes on faces."""
+
+	size = (rand.randint(1, 3), rand.randint(1, 3), rand.randint(1, 3))
+
+	coor = []
+	node_of_key = {}
+	def find_node(point):
+		if point not in node_of_key:
+			node_of_key[point] = len(coor)
+			coor.append(tuple(value + rand.uniform(-jitter, jitter) for value in point))
+		return node_of_key[point]
+
+	face_list = []
+	for axis in range(3):
+		axis_u = (axis + 1)%3
+		axis_v = (axis + 2)%3
+		for side in (0, size[axis]):
+			for u in range(size[axis_u]):
+				for v in range(size[axis_v]):
+					quad = []
+					for du, dv in ((0, 0), (1, 0), (1, 1), (0, 1)):
+						point = [0, 0, 0]
+						point[axis] = side
+						point[axis_u] = u + du
+						point[axis_v] = v + dv
+						quad.append(find_node(tuple(point)))
+					if side == 0: quad.reverse()	#: keep faces oriented outwards
+					face_list.append(tuple(quad))
+
+	return (coor, face_list)
+
+#: random mesh generators, open and closed
+GENERATORS = {'grid': random_grid, 'star': random_star, 'box': random_box}
+
+
+def match_nodes(reference, candidate):
+	"""Function to match every candidate node to the nearest reference node.
+
+	Reference nodes are put into a hash grid with about one node per cell. Each 
+	candidate node searches the shells of cells around its own cell, growing until 
+	no closer node can be found, so the match does not depend on any tolerance and 
+	the distances are measured however large they are.
+
+	Args:
+		reference: list of coordinates, candidate: list of coordinates.
+
+	Returns:
+		match: list, match[candidate index] gives the reference index, 
+			None if there are no reference nodes,
+		distance: list, distance[candidate index] gives the distance to the matched node."""
+
+	if not reference: return ([None]*len(candidate), [float('inf')]*len(candidate))
+
+	lower = [min(point[axis] for point in reference) for axis in range(3)]
+	upper = [max(point[axis] for point in reference) for axis in range(3)]
+	size = math.sqrt(sum((upper[axis] - lower[axis])**2 for axis in range(3)))
+	cell = max(size/len(reference)**(1./3.), 1e-300)
+	grid = {}
+	for node_index in range(len(reference)):
+		key = tuple(int(math.floor(value/cell)) for value in reference[node_index])
+		grid.setdefault(key, []).append(node_index)
+
+	match = []
+	distance = []
+	for point in candidate:
+		key = tuple(int(math.floor(value/cell)) for value in point)
+		best, best_dist = (None, float('inf'))
+		shell = 0
+		#: nodes in shell k + 1 are at least k cells away
+		while (best is None) or (best_dist > (shell - 1)*cell):
+			for dx in range(-shell, shell + 1):
+				for dy in range(-shell, shell + 1):
+					for dz in range(-shell, shell + 1):
+						if max(abs(dx), abs(dy), abs(dz)) != shell: continue
+						for node_index in grid.get((key[0] + dx, key[1] + dy, key[2] + dz), []):
+							dist = math.sqrt(sum((point[axis] - reference[node_index][axis])**2 for axis in range(3)))
+							if dist < best_dist: best, best_dist = (node_index, dist)
+			shell += 1
+		match.append(best)
+		distance.append(best_dist)
+
+	return (match, distance)
+
+def compare_meshes(reference, candidate, tolerance):
+	"""Function to compare two meshes within `tolerance` and up to renumbering.
+
+	Each candidate node is paired with the nearest reference node, the error is the
+	largest distance of the pairs, and the meshes fail if it is above `tolerance`.
+
+	Args:
+		reference: Mesh object, candidate: Mesh object,
+		tolerance: float.
+
+	Returns:
+		error: float, the largest distance between matched nodes,
+		problems: list of String, empty if the meshes agree."""
+
+	problems = []
+	if reference.give_model_inf() != candidate.give_model_inf():
+		problems.append('counts ' + str(reference.give_model_inf()) + ' != ' + str(candidate.give_model_inf()))
+		return (float('inf'), problems)
+
+	n_node, n_edge, n_face = reference.give_model_inf()
+	if n_node == 0: return (0., problems)
+	match, distance = match_nodes(reference.give_nodes().give_coor(), candidate.give_nodes().give_coor())
+	error = max(distance)
+	n_outside = sum(1 for dist in distance if dist > tolerance)
+	if n_outside > 0: problems.append(str(n_outside) + ' nodes not within tolerance')
+	if len(set(match)) != n_node:
+		problems.append('several nodes matched to one reference node')
+
+	def rotate(face):
+		#: the same face may start from another node, keep its orientation
+		start = face.index(min(face))
+		return face[start:] + face[:start]
+
+	reference_faces = sorted(rotate(tuple(reference.give_faces().give_node_list(i))) for i in range(n_face))
+	candidate_faces = sorted(rotate(tuple(match[node] for node in candidate.give_faces().give_node_list(i))) \
+		for i in range(n_face))
+	if reference_faces != candidate_faces: problems.append('faces differ')
+
+	reference_edges = sorted(tuple(sorted(reference.give_edges().give_node(i))) for i in range(n_edge))
+	candidate_edges = sorted(tuple(sorted(match[node] for node in candidate.give_edges().give_node(i))) \
+		for i in range(n_edge))
+	if reference_edges != candidate_edges: problems.append('edges differ')
+
+	return (error, problems)
+
+
+def crosscheck(candidate, n_mesh, levels, seed = 0, tolerance = 1e-9, verbose = True):
+	"""Function to run the reference and a candidate path on random meshes and compare them.
+
+	Args:
+		candidate: function, called as candidate(mesh, levels),
+		n_mesh: int, the number of random meshes,
+		levels: int, the number of subdivisions,
+		seed: int, the seed of the random meshes,
+		tolerance: float, the largest distance allowed between matched nodes,
+		verbose: bool, print one line per mesh.
+
+	Returns:
+		error: float, the worst-case error over all meshes,
+		speedup: float, the total time of the reference over the total time of the candidate,
+		n_failed: int, the number of meshes on which the paths disagree."""
+
+	rand = random.Random(seed)
+	names = sorted(GENERATORS)
+	error, n_failed = (0., 0)
+	reference_time, candidate_time = (0., 0.)
+
+	for mesh_index in range(n_mesh):
+		name = names[mesh_index%len(names)]
+		coor, face_list = GENERATORS[name](rand)
+
+		start_time = time.time()
+		reference = reference_path(geo.mesh_from_faces(coor, face_list), levels)
+		this_reference_time = time.time() - start_time
+
+		start_time = time.time()
+		result = candidate(geo.mesh_from_faces(coor, face_list), levels)
+		this_candidate_time = time.time() - start_time
+
+		this_error, problems = compare_meshes(reference, result, tolerance)
+		error = max(error, this_error)
+		reference_time += this_reference_time
+		candidate_time += this_candidate_time
+		if problems: n_failed += 1
+
+		if verbose:
+			print('--- Mesh {0:3d} {1:5s} {2:6d} faces  error {3:8.2e}  speedup {4:6.2f}  {5}'.format( \
+				mesh_index, name, result.give_model_inf()[2], this_error, \
+				this_reference_time/max(this_candidate_time, 1e-12), ', '.join(problems) or 'ok'))
+
+	return (error, reference_time/max(candidate_time, 1e-12), n_failed)
+
+
+def main(argv):
+	"""Function to cross-check a subdivision path
+
+	Agrs:
+		The input will be passed to main function via `argv`:
+		`-c <candidate>` or `--candidate=<candidate>`: the path to check,
+		`-n <number>` or `--number=<number>`: the number of random meshes (default 20),
+		`-l <levels>` or `--levels=<levels>`: the number of subdivisions (default 2),
+		`-s <seed>` or `--seed=<seed>`: the seed of the random meshes (default 0),
+		`-t <tolerance>` or `--tol=<tolerance>`: the tolerance of coordinates (default 1e-9),
+		`-h` or `--help`: call help"""
+
+	candidate = sorted(CANDIDATES)[0]
+	n_mesh, levels, seed, tolerance = (20, 2, 0, 1e-9)
+
+	try:
+		opts, args = getopt.getopt(argv, "hc:n:l:s:t:", \
+			["candidate=", "number=", "levels=", "seed=", "tol=", "help"])
+	except getopt.GetoptError:
+		print('Error: please try crosscheck.py -c <candidate> -n <number> -l <levels> -s <seed> -t <tolerance>')
+		sys.exit(2)
+
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			print('\ncrosscheck.py -c <candidate> -n <number> -l <levels> -s <seed> -t <tolerance>')
+			print('Candidates: ' + ', '.join(sorted(CANDIDATES)) + '\n')
+			sys.exit()
+		elif opt in ("-c", "--candidate"):
+			if arg not in CANDIDATES:
+				print('!Error: Unknown candidate: ', arg)
+				print('        Try one of: ' + ', '.join(sorted(CANDIDATES)) + '\n')
+				sys.exit(2)
+			candidate = arg
+		elif opt in ("-n", "--number"): n_mesh = int(arg)
+		elif opt in ("-l", "--levels"): levels = int(arg)
+		elif opt in ("-s", "--seed"): seed = int(arg)
+		elif opt in ("-t", "--tol"): tolerance = float(arg)
+
+	print('=== Cross-check of ' + candidate + ' against the reference subdivision')
+	error, speedup, n_failed = crosscheck(CANDIDATES[candidate], n_mesh, levels, seed, tolerance)
+	print('=== Worst-case error {0:8.2e}, speedup {1:6.2f}, {2} of {3} meshes failed\n'.format( \
+		error, speedup, n_failed, n_mesh))
+
+	if n_failed > 0: sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
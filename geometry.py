@@ -8,6 +8,10 @@ from classes in this order: Node -> Edge -> Face -> Mesh.
 @author: Ge Yin
 """
 
+import struct, math, copy
+
+import helper
+
 class Node:
 	"""Storing coordinates of nodes, and functions dealing with coordinates."""
 		
@@ -98,7 +102,7 @@ class Face:
 
 	It includes which nodes and wich edges are in on which face."""
 	
-	def __init__(self, node_list, edges):
+	def __init__(self, node_list, edges, edge_list = None):
 		"""initialise values.
 	
 		Note: 
@@ -117,49 +121,40 @@ class Face:
 				in this code, only linear quad mesh is considered, so the list is
 				[(x0,x1,x2,x3),...].
 			edges: a class Edge input, by inputing edges, the list of which edge is on face 
-				can be determined."""
+				can be determined.
+			edge_list: a list of which edge(indices) is on specific surface, 
+				[(edge0,edge1,edge2,edge3),...] where edge0 links x0 and x1 and so on;
+				if it is already known, `edges` is not searched."""
 		
 		self.__num = len(node_list)
 		self.__node_list = node_list
 		
+		if edge_list is not None:
+			self.__edge_list = edge_list
+			return
+
 		self.__edge_list = []
 
-		#! search the nodes on faces and check whether two nodes are happen to belong to one edge
+		#! look up the edge of each pair of neighbouring nodes on faces, edges are 
+		#  stored without orientation so both orders of the pair are registered
+		edge_of_pair = {}
+		for edge_index in range(edges.give_num_edges()):
+			node_in_edge = edges.give_node(edge_index)
+			edge_of_pair[(node_in_edge[0], node_in_edge[1])] = edge_index
+			edge_of_pair[(node_in_edge[1], node_in_edge[0])] = edge_index
+
 		for face_index in range(self.__num):
-			for edge_index in range(edges.give_num_edges()):
-				node_in_edge = edges.give_node(edge_index)
-
-				if (node_in_edge[0] == node_list[face_index][0]) & \
-					(node_in_edge[1] == node_list[face_index][1]):
-					edge0 = edge_index
-				elif (node_in_edge[1] == node_list[face_index][0]) & \
-					(node_in_edge[0] == node_list[face_index][1]):
-					edge0 = edge_index
-
-				if (node_in_edge[0] == node_list[face_index][1]) & \
-					(node_in_edge[1] == node_list[face_index][2]):
-					edge1 = edge_index
-				elif (node_in_edge[1] == node_list[face_index][1]) & \
-					(node_in_edge[0] == node_list[face_index][2]):
-					edge1 = edge_index
-	
-				if (node_in_edge[0] == node_list[face_index][2]) & \
-					(node_in_edge[1] == node_list[face_index][3]):
-					edge2 = edge_index
-				elif (node_in_edge[1] == node_list[face_index][2]) & \
-					(node_in_edge[0] == node_list[face_index][3]):
-					edge2 = edge_index
-						
-				if (node_in_edge[0] == node_list[face_index][3]) & \
-					(node_in_edge[1] == node_list[face_index][0]):
-					edge3 = edge_index
-				elif (node_in_edge[1] == node_list[face_index][3]) & \
-					(node_in_edge[0] == node_list[face_index][0]):
-					edge3 = edge_index
-						
-			self.__edge_list.append((edge0, edge1, edge2, edge3))
+			this_face = node_list[face_index]
+			edge_in_face = []
+			for vertex_index in range(4):
+				pair = (this_face[vertex_index], this_face[(vertex_index + 1)%4])
+				if pair not in edge_of_pair:
+					raise ValueError('Edge ' + str(pair) + ' of FACE ' + str(face_index) + \
+						' is not in the edge list')
+				edge_in_face.append(edge_of_pair[pair])
+					
+			self.__edge_list.append(tuple(edge_in_face))
 
-				
 	def give_edge_list(self, index):
 		return self.__edge_list[index]
 		
@@ -185,7 +180,7 @@ class Face:
 class Mesh:
 	"""Class Mesh includes all required mesh and geometric information for subdivision"""
 	
-	def __init__(self, file_dir):
+	def __init__(self, file_dir = None, weld = None):
 		"""Initialise the class with a input file directory.
 	
 		Args: 
@@ -194,53 +189,44 @@ class Mesh:
 				1.number of nodes  number of edges  number of faces,
 				2.coordinates,
 				3.connectivity of edges,
-				4.connectivity of faces."""
+				4.connectivity of faces.
+				If the number of edges is 0, the connectivity of edges is left out 
+				and derived from the faces. Files ending with `.obj` or `.ply` are 
+				read as Wavefront OBJ or PLY quad meshes instead.
+				If no file is given, the mesh is empty until `update` is called.
+			weld: float, if given, nodes closer than `weld` are welded and duplicate 
+				edges and faces are removed after loading, see function clean_mesh;
+				what was merged can be seen in `give_cleanup_report`."""
 			
 		self.__dir = file_dir
+		self.__cleanup_report = None
+		if file_dir is None:
+			self.__n_node, self.__n_edge, self.__n_face = (0, 0, 0)
+			self.__node_valence, self.__edge_valence = ([], [])
+			self.__node_order, self.__edge_order, self.__face_order = (None, None, None)
+			return
 
-		file = open(self.__dir, 'r')
-		
-		texts = []
-		for line in file.readlines():
-			for line_seg in line.splitlines():
-				for text in line_seg.split():
-					if (text != ' ') & (text != 'n'): texts.append(text)
-		
-		file.close()
-				
-		self.__n_node = int(texts[0])
-		self.__n_edge = int(texts[1])
-		self.__n_face = int(texts[2])
-		
-		coor = []
-		for node_index in range(self.__n_node):
-			x = float(texts[node_index*3 + 3])
-			y = float(texts[node_index*3 + 4])
-			z = float(texts[node_index*3 + 5])
-			coor.append((x, y, z))
-
-		self.__nodes = Node(coor)
-			
-		edge_list = []	
-		for edge_index in range(self.__n_edge):
-			start_node = int(texts[edge_index*2 + 3 + self.__n_node*3])
-			end_node = int(texts[edge_index*2 + 4 + self.__n_node*3])
-			edge_list.append((start_node, end_node))
-			
-		self.__edges = Edge(edge_list)
-		
-		face_list = []
-		for face_index in range(self.__n_face):
-			node0 = int(texts[face_index*4 + 3 + self.__n_node*3 + self.__n_edge*2])
-			node1 = int(texts[face_index*4 + 4 + self.__n_node*3 + self.__n_edge*2])
-			node2 = int(texts[face_index*4 + 5 + self.__n_node*3 + self.__n_edge*2])
-			node3 = int(texts[face_index*4 + 6 + self.__n_node*3 + self.__n_edge*2])
-			
-			face_list.append((node0, node1, node2, node3))
-		
-		self.__faces = Face(face_list, self.__edges)	
+		extension = file_dir.lower().rsplit('.', 1)[-1]
+		if extension == 'obj':
+			coor, face_list = read_obj(file_dir)
+			edge_list = None
+		elif extension == 'ply':
+			coor, face_list = read_ply(file_dir)
+			edge_list = None
+		else:
+			coor, edge_list, face_list = read_dat(file_dir)
+
+		if weld is not None:
+			coor, edge_list, face_list, self.__cleanup_report = clean_mesh(coor, face_list, edge_list, weld)
+
+		#: derived edges come with the edges on faces, given ones are looked up by Face
+		face_edge_list = None
+		if edge_list is None: edge_list, face_edge_list = derive_edges(face_list)
+		edges = Edge(edge_list)
 
-	def update(self, nodes, edges, faces):
+		self.update(Node(coor), edges, Face(face_list, edges, face_edge_list))
+
+	def update(self, nodes, edges, faces, node_valence = None, edge_valence = None, order = None):
 		"""This function is for updating the mesh information using subdivision.
 		
 		Args:
@@ -250,7 +236,14 @@ class Mesh:
 				   pass the connectivity of edges in Class Edge to self.__edges,
 			faces: Face object
 				   pass the connectivity of faces in class Face to self.__faces,
-				   and also update the total number of nodes, edges and faces."""
+				   and also update the total number of nodes, edges and faces.
+			node_valence: list, the number of faces sharing each node,
+			edge_valence: list, the number of faces sharing each edge; both are 
+				   counted from the faces if not given, subdivision passes them on
+				   from the previous level,
+			order: (node_order, edge_order, face_order), where node_order[index] gives 
+				   the index node `index` would have if no level had been renumbered, 
+				   see function reorder_mesh; None if the mesh was never renumbered."""
 			
 		self.__nodes = nodes
 		self.__edges = edges
@@ -258,6 +251,14 @@ class Mesh:
 		self.__n_node = nodes.give_num_nodes()
 		self.__n_edge = edges.give_num_edges()
 		self.__n_face = faces.give_num_faces()
+
+		if (node_valence is None) or (edge_valence is None):
+			node_valence, edge_valence = helper.find_classification(self.__n_node, edges, faces)
+		self.__node_valence = node_valence
+		self.__edge_valence = edge_valence
+
+		if order is None: order = (None, None, None)
+		self.__node_order, self.__edge_order, self.__face_order = order
 	
 	def print_model_inf(self):
 		"""This function prints all node, edge and face information.
@@ -279,13 +280,743 @@ class Mesh:
 	def give_nodes(self):
 		return self.__nodes
 
+	def give_node_valence(self, index = None):
+		if index is None: return self.__node_valence
+		else: return self.__node_valence[index]
+
+	def give_edge_valence(self, index = None):
+		if index is None: return self.__edge_valence
+		else: return self.__edge_valence[index]
+
+	def give_node_order(self):
+		return self.__node_order
+
+	def give_edge_order(self):
+		return self.__edge_order
+
+	def give_face_order(self):
+		return self.__face_order
+
 	def give_edges(self):
 		return self.__edges
 		
 	def give_faces(self):
 		return self.__faces		
+
+	def give_cleanup_report(self):
+		return self.__cleanup_report
 		
 
+class PatchMesh:
+	"""Storing the refined region of each base face as a dense grid of coordinates.
+
+	Inside each quad of the base mesh, subdivision gives a regular grid; only the 
+	base nodes can have another valence than 4. Each base face keeps a 
+	(n+1)*(n+1) grid of coordinates, n = 2**level, where grid[i][j] runs from node 
+	x0 to x1 with i and from x0 to x3 with j:
+	        j
+	        x3-----x2
+	        |       |
+	        |       |
+	        x0-----x1 i
+	The outer rows and columns are the strips along base edges, shared with the
+	neighbouring faces, and the grid corners are the base nodes."""
+
+	def __init__(self, mesh):
+		"""Sets initial values from the base mesh at level 0.
+
+		Args:
+			mesh: Mesh object, the base mesh; later updates of it do not affect the grids."""
+
+		mesh = copy.copy(mesh)
+		n_node, n_edge, n_face = mesh.give_model_inf()
+		coor = mesh.give_nodes().give_coor()
+		faces = mesh.give_faces()
+
+		self.__base = mesh
+		self.__n = 1
+		self.__grids = []
+		self.__edge_sides = [[] for edge_index in range(n_edge)]	#: (face, side) along each base edge
+		self.__node_corners = [[] for node_index in range(n_node)]	#: (face, corner) at each base node
+		self.__node_edges = [[] for node_index in range(n_node)]	#: base edges at each base node
+
+		for face_index in range(n_face):
+			node0, node1, node2, node3 = faces.give_node_list(face_index)
+			self.__grids.append([[coor[node0], coor[node3]], [coor[node1], coor[node2]]])
+			for vertex_index in range(4):
+				self.__node_corners[faces.give_node_list(face_index)[vertex_index]].append((face_index, vertex_index))
+				self.__edge_sides[faces.give_edge_list(face_index)[vertex_index]].append((face_index, vertex_index))
+
+		for edge_index in range(n_edge):
+			for node_index in set(mesh.give_edges().give_node(edge_index)):
+				self.__node_edges[node_index].append(edge_index)
+
+	def update(self, grids):
+		"""Function to replace the grids of all base faces by the grids of the next level."""
+
+		self.__grids = grids
+		self.__n = len(grids[0]) - 1
+
+	def give_base(self):
+		return self.__base
+
+	def give_num_segments(self):
+		return self.__n
+
+	def give_grid(self, index = None):
+		if index is None: return self.__grids
+		else: return self.__grids[index]
+
+	def give_edge_sides(self, index):
+		return self.__edge_sides[index]
+
+	def give_node_corners(self, index):
+		return self.__node_corners[index]
+
+	def give_node_edges(self, index):
+		return self.__node_edges[index]
+
+	def is_forward(self, edge_index, face_index, side):
+		"""Function to tell whether `side` of a face runs in the same direction as the base edge.
+
+		Side 0 runs from x0 to x1, side 1 from x1 to x2 and so on."""
+
+		start_node = self.__base.give_faces().give_node_list(face_index)[side]
+		return start_node == self.__base.give_edges().give_node(edge_index)[0]
+
+	def to_mesh(self):
+		"""Function to assemble the grids into a Mesh object.
+
+		Nodes are numbered as in function subdivision: nodes of the previous level keep 
+		their index and new nodes follow; within one level, the inner nodes of the strip 
+		of each base edge come first, then the inner nodes of each grid. The valences are 
+		known from the grid layout, so no lookups are needed.
+
+		Returns:
+			mesh: Mesh object."""
+
+		n = self.__n
+		base = self.__base
+		n_node, n_edge, n_face = base.give_model_inf()
+
+		coor = [None]*n_node
+		node_valence = list(base.give_node_valence())
+		level = n.bit_length() - 1
+		node_level = [0]*n_node	#: the level at which each node was generated
+
+		def find_level(i, j = 0):
+			#: a grid position divisible by 2**m already existed m levels before
+			m = min((i & -i).bit_length() - 1 if i else level, (j & -j).bit_length() - 1 if j else level)
+			return level - m
+
+		for node_index in range(n_node):
+			if self.__node_corners[node_index]:
+				face_index, corner = self.__node_corners[node_index][0]
+				coor[node_index] = self.__grids[face_index][(0, n, n, 0)[corner]][(0, 0, n, n)[corner]]
+			else: coor[node_index] = base.give_nodes().give_coor(node_index)
+
+		#! nodes and edges along base edges, ordered from the first node of the edge
+		strip_node = []
+		strip_edge = []
+		edge_list = []
+		edge_valence = []
+		for edge_index in range(n_edge):
+			start_node, end_node = base.give_edges().give_node(edge_index)
+			this_strip = [start_node]
+			if self.__edge_sides[edge_index]:
+				face_index, side = self.__edge_sides[edge_index][0]
+				forward = self.is_forward(edge_index, face_index, side)
+				grid = self.__grids[face_index]
+				for k in range(1, n):
+					t = k if forward else n - k
+					i, j = ((t, 0), (n, t), (n - t, n), (0, n - t))[side]
+					this_strip.append(len(coor))
+					coor.append(grid[i][j])
+					node_valence.append(2*base.give_edge_valence(edge_index))
+					node_level.append(find_level(k))
+			this_strip.append(end_node)
+			strip_node.append(this_strip)
+
+			strip_edge.append(list(range(len(edge_list), len(edge_list) + len(this_strip) - 1)))
+			for k in range(len(this_strip) - 1):
+				edge_list.append((this_strip[k], this_strip[k + 1]))
+				edge_valence.append(base.give_edge_valence(edge_index))
+
+		#! nodes, edges and faces inside each grid
+		face_list = []
+		face_edge_list = []
+		for face_index in range(n_face):
+			grid = self.__grids[face_index]
+			node = [[None]*(n + 1) for i in range(n + 1)]
+			edge_u = [[None]*(n + 1) for i in range(n)]	#: edge from node[i][j] to node[i+1][j]
+			edge_v = [[None]*n for i in range(n + 1)]	#: edge from node[i][j] to node[i][j+1]
+
+			for side in range(4):
+				edge_index = base.give_faces().give_edge_list(face_index)[side]
+				forward = self.is_forward(edge_index, face_index, side)
+				for t in range(n + 1):
+					i, j = ((t, 0), (n, t), (n - t, n), (0, n - t))[side]
+					node[i][j] = strip_node[edge_index][t if forward else n - t]
+				for s in range(n):
+					segment = strip_edge[edge_index][s if forward else n - 1 - s]
+					if side == 0: edge_u[s][0] = segment
+					elif side == 1: edge_v[n][s] = segment
+					elif side == 2: edge_u[n - s - 1][n] = segment
+					else: edge_v[0][n - s - 1] = segment
+
+			for i in range(1, n):
+				for j in range(1, n):
+					node[i][j] = len(coor)
+					coor.append(grid[i][j])
+					node_valence.append(4)
+					node_level.append(find_level(i, j))
+			for i in range(n):
+				for j in range(1, n):
+					edge_u[i][j] = len(edge_list)
+					edge_list.append((node[i][j], node[i + 1][j]))
+					edge_valence.append(2)
+			for i in range(1, n):
+				for j in range(n):
+					edge_v[i][j] = len(edge_list)
+					edge_list.append((node[i][j], node[i][j + 1]))
+					edge_valence.append(2)
+
+			for i in range(n):
+				for j in range(n):
+					face_list.append((node[i][j], node[i + 1][j], node[i + 1][j + 1], node[i][j + 1]))
+					face_edge_list.append((edge_u[i][j], edge_v[i + 1][j], edge_u[i][j + 1], edge_v[i][j]))
+
+		#! renumber the nodes level by level, keeping the order within a level
+		level_nodes = [[] for this_level in range(level + 1)]
+		for node_index in range(len(coor)): level_nodes[node_level[node_index]].append(node_index)
+		node_order = [node_index for this_level in level_nodes for node_index in this_level]
+		new_index = [0]*len(coor)
+		for index in range(len(coor)): new_index[node_order[index]] = index
+		coor = [coor[node_index] for node_index in node_order]
+		node_valence = [node_valence[node_index] for node_index in node_order]
+		edge_list = [(new_index[start_node], new_index[end_node]) for start_node, end_node in edge_list]
+		face_list = [(new_index[node0], new_index[node1], new_index[node2], new_index[node3]) \
+			for node0, node1, node2, node3 in face_list]
+
+		edges = Edge(edge_list)
+		mesh = Mesh()
+		mesh.update(Node(coor), edges, Face(face_list, edges, face_edge_list), node_valence, edge_valence)
+		return mesh
+
+
+def read_dat(file_dir):
+	"""Function to read the *.dat mesh file described in class Mesh.
+
+	Args:
+		file_dir: String, the directory of the input file.
+
+	Returns:
+		coor: list of coordinates [(x1,y1,z1),...],
+		edge_list: list of pairs of nodes, or None if the file has no edge section,
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...]."""
+
+	file = open(file_dir, 'r')
+	
+	texts = []
+	for line in file.readlines():
+		for line_seg in line.splitlines():
+			for text in line_seg.split():
+				if (text != ' ') & (text != 'n'): texts.append(text)
+	
+	file.close()
+			
+	n_node = int(texts[0])
+	n_edge = int(texts[1])
+	n_face = int(texts[2])
+	
+	coor = []
+	for node_index in range(n_node):
+		x = float(texts[node_index*3 + 3])
+		y = float(texts[node_index*3 + 4])
+		z = float(texts[node_index*3 + 5])
+		coor.append((x, y, z))
+
+	edge_list = []	
+	for edge_index in range(n_edge):
+		start_node = int(texts[edge_index*2 + 3 + n_node*3])
+		end_node = int(texts[edge_index*2 + 4 + n_node*3])
+		edge_list.append((start_node, end_node))
+	if n_edge == 0: edge_list = None
+	
+	face_list = []
+	for face_index in range(n_face):
+		node0 = int(texts[face_index*4 + 3 + n_node*3 + n_edge*2])
+		node1 = int(texts[face_index*4 + 4 + n_node*3 + n_edge*2])
+		node2 = int(texts[face_index*4 + 5 + n_node*3 + n_edge*2])
+		node3 = int(texts[face_index*4 + 6 + n_node*3 + n_edge*2])
+		
+		face_list.append((node0, node1, node2, node3))
+
+	return (coor, edge_list, face_list)
+
+
+def read_obj(file_dir):
+	"""Function to read a Wavefront *.obj file with quad faces.
+
+	Note:
+		Only `v` and `f` records are used, texture and normal indices in `f` records
+		(`v/vt/vn`) are dropped and negative (relative) indices are supported.
+
+	Args:
+		file_dir: String, the directory of the input file.
+
+	Returns:
+		coor: list of coordinates [(x1,y1,z1),...],
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...]."""
+
+	coor = []
+	face_list = []
+
+	file = open(file_dir, 'r')
+	for line in file:
+		texts = line.split()
+		if len(texts) == 0: continue
+
+		if texts[0] == 'v':
+			coor.append((float(texts[1]), float(texts[2]), float(texts[3])))
+
+		elif texts[0] == 'f':
+			if len(texts) != 5:
+				file.close()
+				raise ValueError('Only quad faces are supported, got a face with ' + \
+					str(len(texts) - 1) + ' nodes in ' + file_dir)
+			face = []
+			for text in texts[1:]:
+				node_index = int(text.split('/')[0])
+				if node_index < 0: face.append(len(coor) + node_index)
+				else: face.append(node_index - 1)
+			face_list.append(tuple(face))
+
+	file.close()
+
+	return (coor, face_list)
+
+
+#: struct formats of the scalar types in PLY headers
+PLY_TYPES = {'char': 'b', 'int8': 'b', 'uchar': 'B', 'uint8': 'B',
+	'short': 'h', 'int16': 'h', 'ushort': 'H', 'uint16': 'H',
+	'int': 'i', 'int32': 'i', 'uint': 'I', 'uint32': 'I',
+	'float': 'f', 'float32': 'f', 'double': 'd', 'float64': 'd'}
+
+def read_ply(file_dir):
+	"""Function to read a *.ply file with quad faces.
+
+	Note:
+		Both binary (little and big endian) and ascii PLY are supported. Coordinates 
+		are taken from the `x`, `y`, `z` properties of element `vertex`, faces from 
+		the list property `vertex_indices` (or `vertex_index`) of element `face`, 
+		other elements and properties are skipped.
+
+	Args:
+		file_dir: String, the directory of the input file.
+
+	Returns:
+		coor: list of coordinates [(x1,y1,z1),...],
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...]."""
+
+	file = open(file_dir, 'rb')
+
+	if file.readline().strip() != b'ply':
+		file.close()
+		raise ValueError('Not a PLY file: ' + file_dir)
+
+	#: elements: [(name, count, [(property name, type, list count type or None),...]),...]
+	elements = []
+	file_format = 'ascii'
+	while True:
+		texts = file.readline().decode('ascii').split()
+		if len(texts) == 0: continue
+		if texts[0] == 'end_header': break
+		if texts[0] == 'format': file_format = texts[1]
+		elif texts[0] == 'element': elements.append((texts[1], int(texts[2]), []))
+		elif texts[0] == 'property':
+			if texts[1] == 'list': elements[-1][2].append((texts[4], texts[3], texts[2]))
+			else: elements[-1][2].append((texts[2], texts[1], None))
+
+	if file_format == 'ascii': endian = None
+	elif file_format == 'binary_little_endian': endian = '<'
+	elif file_format == 'binary_big_endian': endian = '>'
+	else:
+		file.close()
+		raise ValueError('Unknown PLY format ' + file_format + ' in ' + file_dir)
+
+	data = file.read()
+	file.close()
+	if endian is None: data = data.split()
+
+	coor = []
+	face_list = []
+	position = 0
+	for name, count, properties in elements:
+		names = [prop[0] for prop in properties]
+		records, position = read_ply_element(data, position, count, properties, endian)
+
+		if name == 'vertex':
+			x, y, z = (names.index('x'), names.index('y'), names.index('z'))
+			for record in records:
+				coor.append((float(record[x]), float(record[y]), float(record[z])))
+
+		elif name == 'face':
+			if 'vertex_indices' in names: index = names.index('vertex_indices')
+			else: index = names.index('vertex_index')
+			for record in records:
+				if len(record[index]) != 4:
+					raise ValueError('Only quad faces are supported, got a face with ' + \
+						str(len(record[index])) + ' nodes in ' + file_dir)
+				face_list.append(tuple(record[index]))
+
+	return (coor, face_list)
+
+def read_ply_element(data, position, count, properties, endian):
+	"""Function to read all records of one element in the body of a PLY file.
+
+	Note:
+		Binary elements with only scalar properties are unpacked in one block, so are 
+		elements with a single list property as long as every list holds 4 values 
+		(quad faces); a record of another length stops the block read, which is then 
+		finished record by record.
+
+	Args:
+		data: bytes of the binary body, or list of words of the ascii body,
+		position: int, the byte (binary) or word (ascii) the element starts at,
+		count: int, the number of records,
+		properties: list of (property name, type, list count type or None),
+		endian: '<' or '>' for binary, None for ascii.
+
+	Returns:
+		records: list of tuples, one value (or tuple for list properties) per property,
+		position: int, the position behind the element."""
+
+	records = []
+	if endian is not None:
+		if all(prop[2] is None for prop in properties):
+			record_struct = struct.Struct(endian + ''.join(PLY_TYPES[prop[1]] for prop in properties))
+			end = position + record_struct.size*count
+			records = list(record_struct.iter_unpack(data[position:end]))
+			return (records, end)
+
+		if len(properties) == 1:
+			record_struct = struct.Struct(endian + PLY_TYPES[properties[0][2]] + 4*PLY_TYPES[properties[0][1]])
+			while (len(records) < count) and (position + record_struct.size <= len(data)):
+				record = record_struct.unpack_from(data, position)
+				if record[0] != 4: break
+				records.append((record[1:],))
+				position += record_struct.size
+
+	for record_index in range(len(records), count):
+		record = []
+		for prop_name, type_name, count_type in properties:
+			if count_type is None: 
+				value, position = read_ply_value(data, position, type_name, endian)
+			else:
+				n_value, position = read_ply_value(data, position, count_type, endian)
+				value = []
+				for value_index in range(n_value):
+					this_value, position = read_ply_value(data, position, type_name, endian)
+					value.append(this_value)
+				value = tuple(value)
+			record.append(value)
+		records.append(tuple(record))
+
+	return (records, position)
+
+def read_ply_value(data, position, type_name, endian):
+	"""Function to read one scalar value of type `type_name` from the body of a PLY file.
+
+	Returns:
+		value: int or float,
+		position: int, the position behind the value."""
+
+	if endian is None:
+		if PLY_TYPES[type_name] in 'fd': return (float(data[position]), position + 1)
+		return (int(data[position]), position + 1)
+
+	value = struct.unpack_from(endian + PLY_TYPES[type_name], data, position)[0]
+	return (value, position + struct.calcsize(PLY_TYPES[type_name]))
+
+
+def derive_edges(face_list):
+	"""Function to derive the edges from the nodes on faces in one pass.
+
+	Args:
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...].
+
+	Returns:
+		edge_list: list of pairs of nodes, in the order the edges first appear on faces,
+		face_edge_list: list of edges on faces [(edge0,edge1,edge2,edge3),...], where 
+			edge0 links node x0 and x1, edge1 links x1 and x2 and so on."""
+
+	edge_list = []
+	face_edge_list = []
+	edge_of_pair = {}
+	for this_face in face_list:
+		edge_in_face = []
+		for vertex_index in range(4):
+			start_node = this_face[vertex_index]
+			end_node = this_face[(vertex_index + 1)%4]
+			pair = (min(start_node, end_node), max(start_node, end_node))
+			if pair not in edge_of_pair:
+				edge_of_pair[pair] = len(edge_list)
+				edge_list.append((start_node, end_node))
+			edge_in_face.append(edge_of_pair[pair])
+		face_edge_list.append(tuple(edge_in_face))
+
+	return (edge_list, face_edge_list)
+
+
+def clean_mesh(coor, face_list, edge_list = None, tolerance = 0.):
+	"""Function to weld coincident nodes and remove duplicate edges and faces.
+
+	Exported meshes often contain several nodes at one position, which splits the 
+	surface and gives bogus boundary edges. Nodes are put into a hash grid with cells 
+	of size `tolerance`; a node within `tolerance` of an earlier kept node, searched in 
+	the 27 cells around it, is welded to it. Faces which lose a node by welding and 
+	repeated faces (same nodes in any order) are removed, so are nodes no face uses.
+	Given edges are kept if they are on a face and not repeated, edges missing on 
+	faces are added.
+
+	Args:
+		coor: list of coordinates [(x1,y1,z1),...],
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...],
+		edge_list: list of pairs of nodes, or None if edges are derived later,
+		tolerance: float, the largest distance of nodes to be welded.
+
+	Returns:
+		coor: list of coordinates after cleanup,
+		edge_list: list of pairs of nodes after cleanup, or None if not given,
+		face_list: list of nodes on faces after cleanup,
+		report: dict, the number of welded nodes, unused nodes, degenerate and 
+			duplicate faces, and dropped and added edges."""
+
+	report = {'welded nodes': 0, 'unused nodes': 0, 'degenerate faces': 0, 'duplicate faces': 0, \
+		'dropped edges': 0, 'added edges': 0}
+
+	#! weld nodes
+	cell = float(tolerance)
+	grid = {}
+	weld_to = []
+	for node_index in range(len(coor)):
+		point = coor[node_index]
+		if cell > 0.: key = tuple(int(math.floor(value/cell)) for value in point)
+		else: key = tuple(point)
+
+		target = node_index
+		if cell > 0.:
+			for dx in (-1, 0, 1):
+				for dy in (-1, 0, 1):
+					for dz in (-1, 0, 1):
+						for other in grid.get((key[0] + dx, key[1] + dy, key[2] + dz), []):
+							if (target == node_index) and (math.sqrt(sum((point[axis] - coor[other][axis])**2 \
+								for axis in range(3))) <= tolerance): target = other
+		elif key in grid: target = grid[key][0]
+
+		if target == node_index: grid.setdefault(key, []).append(node_index)
+		else: report['welded nodes'] += 1
+		weld_to.append(target)
+
+	#! remove degenerate and duplicate faces
+	new_face_list = []
+	seen_faces = set()
+	for this_face in face_list:
+		face = tuple(weld_to[node] for node in this_face)
+		if len(set(face)) < 4:
+			report['degenerate faces'] += 1
+			continue
+		if tuple(sorted(face)) in seen_faces:
+			report['duplicate faces'] += 1
+			continue
+		seen_faces.add(tuple(sorted(face)))
+		new_face_list.append(face)
+
+	#! renumber the nodes used by faces
+	new_index = [None]*len(coor)
+	new_coor = []
+	for face in new_face_list:
+		for node in face:
+			if new_index[node] is None:
+				new_index[node] = len(new_coor)
+				new_coor.append(coor[node])
+	report['unused nodes'] = len(coor) - report['welded nodes'] - len(new_coor)
+	for node_index in range(len(coor)):
+		if new_index[node_index] is None: new_index[node_index] = new_index[weld_to[node_index]]
+	new_face_list = [tuple(new_index[node] for node in face) for face in new_face_list]
+
+	#! keep the given edges which are on faces, then add the missing ones
+	if edge_list is None: return (new_coor, None, new_face_list, report)
+
+	face_edge_list = derive_edges(new_face_list)[0]
+	on_face = set((min(edge), max(edge)) for edge in face_edge_list)
+	kept = set()
+	new_edge_list = []
+	for start_node, end_node in edge_list:
+		start_node, end_node = (new_index[start_node], new_index[end_node])
+		if (start_node is None) or (end_node is None): pair = None
+		else: pair = (min(start_node, end_node), max(start_node, end_node))
+		if (pair in on_face) and (pair not in kept):
+			kept.add(pair)
+			new_edge_list.append((start_node, end_node))
+		else: report['dropped edges'] += 1
+	for edge in face_edge_list:
+		if (min(edge), max(edge)) not in kept:
+			new_edge_list.append(edge)
+			report['added edges'] += 1
+
+	return (new_coor, new_edge_list, new_face_list, report)
+
+
+def mesh_from_faces(coor, face_list, edge_list = None):
+	"""Function to build a Mesh object from lists instead of a file.
+
+	Args:
+		coor: list of coordinates [(x1,y1,z1),...],
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...],
+		edge_list: list of pairs of nodes, derived from the faces if not given.
+
+	Returns:
+		mesh: Mesh object."""
+
+	face_edge_list = None
+	if edge_list is None: edge_list, face_edge_list = derive_edges(face_list)
+	edges = Edge(edge_list)
+
+	mesh = Mesh()
+	mesh.update(Node(coor), edges, Face(face_list, edges, face_edge_list))
+	return mesh
+
+
+def reorder_mesh(mesh, method = 'rcm'):
+	"""Function to renumber nodes, edges and faces of a mesh for cache-friendly access.
+
+	Subdivision numbers existing nodes first, then face nodes, then edge nodes, so 
+	neighbouring nodes end up far apart. This function renumbers them so that 
+	neighbours get close indices, faces and edges are then sorted by their nodes.
+	The orientation of faces and edges is kept. The permutations are composed with 
+	those of earlier renumberings and kept by the mesh, see Mesh.give_node_order, 
+	so indices can be mapped back to the order subdivision gives without renumbering.
+
+	Args:
+		mesh: Mesh object, updated with the renumbered nodes, edges and faces,
+		method: 'rcm' for reverse Cuthill-McKee on the edge graph, 
+			'morton' for the Z-order space-filling curve over the coordinates.
+
+	Returns:
+		node_order: list, node_order[new index] gives the old index of a node,
+		face_order: list, face_order[new index] gives the old index of a face."""
+
+	n_node, n_edge, n_face = mesh.give_model_inf()
+	coor = mesh.give_nodes().give_coor()
+	edges = mesh.give_edges()
+	faces = mesh.give_faces()
+
+	if method == 'rcm': node_order = find_rcm_order(n_node, [edges.give_node(i) for i in range(n_edge)])
+	elif method == 'morton': node_order = find_morton_order(coor)
+	else: raise ValueError('Unknown reordering method: ' + str(method))
+
+	new_index = [0]*n_node
+	for index in range(n_node): new_index[node_order[index]] = index
+
+	new_coor = [coor[old_index] for old_index in node_order]
+
+	new_edge_list = []
+	for edge_index in range(n_edge):
+		start_node, end_node = edges.give_node(edge_index)
+		new_edge_list.append((new_index[start_node], new_index[end_node]))
+	edge_order = sorted(range(n_edge), key = lambda edge_index: \
+		(min(new_edge_list[edge_index]), max(new_edge_list[edge_index])))
+	new_edge_list = [new_edge_list[edge_index] for edge_index in edge_order]
+
+	new_face_list = []
+	for face_index in range(n_face):
+		new_face_list.append(tuple(new_index[node] for node in faces.give_node_list(face_index)))
+	face_order = sorted(range(n_face), key = lambda face_index: min(new_face_list[face_index]))
+	new_face_list = [new_face_list[face_index] for face_index in face_order]
+
+	new_edges = Edge(new_edge_list)
+	node_valence = [mesh.give_node_valence(old_index) for old_index in node_order]
+	edge_valence = [mesh.give_edge_valence(old_index) for old_index in edge_order]
+
+	order = (node_order, edge_order, face_order)
+	if mesh.give_node_order() is not None:
+		order = ([mesh.give_node_order()[old_index] for old_index in node_order], \
+			[mesh.give_edge_order()[old_index] for old_index in edge_order], \
+			[mesh.give_face_order()[old_index] for old_index in face_order])
+
+	mesh.update(Node(new_coor), new_edges, Face(new_face_list, new_edges), node_valence, edge_valence, order)
+
+	return (node_order, face_order)
+
+def find_rcm_order(n_node, edge_list):
+	"""Function to work out the reverse Cuthill-McKee order of nodes.
+
+	Each connected part is searched breadth first from a node of lowest degree, 
+	neighbours are visited in order of increasing degree, the order is reversed in the end.
+
+	Args:
+		n_node: int, the number of nodes,
+		edge_list: list of pairs of nodes.
+
+	Returns:
+		node_order: list of node indices in the new order."""
+
+	neighbour = [[] for node_index in range(n_node)]
+	for start_node, end_node in edge_list:
+		neighbour[start_node].append(end_node)
+		neighbour[end_node].append(start_node)
+	for node_list in neighbour:
+		node_list.sort(key = lambda node: len(neighbour[node]))
+
+	visited = [False]*n_node
+	node_order = []
+	for start_node in sorted(range(n_node), key = lambda node: len(neighbour[node])):
+		if visited[start_node]: continue
+		visited[start_node] = True
+		node_order.append(start_node)
+
+		head = len(node_order) - 1
+		while head < len(node_order):
+			for node in neighbour[node_order[head]]:
+				if not visited[node]:
+					visited[node] = True
+					node_order.append(node)
+			head += 1
+
+	node_order.reverse()
+	return node_order
+
+def find_morton_order(coor, bits = 10):
+	"""Function to work out the order of nodes along the Z-order (Morton) curve.
+
+	Args:
+		coor: list of coordinates [(x1,y1,z1),...],
+		bits: int, the resolution of the curve per axis.
+
+	Returns:
+		node_order: list of node indices in the new order."""
+
+	if len(coor) == 0: return []
+
+	lower = [min(point[axis] for point in coor) for axis in range(3)]
+	upper = [max(point[axis] for point in coor) for axis in range(3)]
+	scale = [((1 << bits) - 1)/(upper[axis] - lower[axis]) if upper[axis] > lower[axis] else 0. \
+		for axis in range(3)]
+
+	code = []
+	for point in coor:
+		cell = [int((point[axis] - lower[axis])*scale[axis]) for axis in range(3)]
+		this_code = 0
+		for bit in range(bits - 1, -1, -1):
+			for axis in range(3):
+				this_code = (this_code << 1) | ((cell[axis] >> bit) & 1)
+		code.append(this_code)
+
+	return sorted(range(len(coor)), key = lambda node: code[node])
+
+
 def main():
 	#class show case
 	print('Running geometry.py')
@@ -4,147 +4,153 @@
 @author: Ge Yin
 """
 
-def find_edge_shared_by_which_faces(edges, faces):
-	"""Given an edge, this function can provide a list of faces which share this edge.
-	
+import sys
+
+def find_classification(n_node, edges, faces):
+	"""The function to count the valence of all nodes and edges in one pass over the faces.
+
+	Note:
+		A node or edge of valence 1 is shared by one face only: a corner node or a 
+		boundary edge. This is used once for an input mesh, subdivision works out
+		the valences of the next level from the current one.
+
 	Args:
-		edges: Edge object, provides the edge information and
-		faces: Face object, with face connectivities.
-			
+		n_node: int, the number of nodes,
+		edges: Edge object,
+		faces: Face object, contains face connectivities and the edges on faces.
+
 	Returns:
-		edge_share_by_which_face: a list of faces."""
-			
-	edge_share_by_which_faces = []
-	for edge_index in range(edges.give_num_edges()):
-		shared_surface = []
-		for face_index in range(faces.give_num_faces()):
-			
-			node_in_edge = edges.give_node(edge_index)
-
-			#: search through all edges and faces, determine how many faces on sepecific edge lies on   
-			edge_is_in_face = False
-			if (node_in_edge[0] == faces.give_node_list(face_index)[0]) & \
-				(node_in_edge[1] == faces.give_node_list(face_index)[1]):
-				edge_is_in_face = True
-			elif (node_in_edge[1] == faces.give_node_list(face_index)[0]) & \
-				(node_in_edge[0] == faces.give_node_list(face_index)[1]):
-				edge_is_in_face = True	
-
-			if (node_in_edge[0] == faces.give_node_list(face_index)[1]) & \
-				(node_in_edge[1] == faces.give_node_list(face_index)[2]):
-				edge_is_in_face = True
-			elif (node_in_edge[1] == faces.give_node_list(face_index)[1]) & \
-				(node_in_edge[0] == faces.give_node_list(face_index)[2]):
-				edge_is_in_face = True
-	
-			if (node_in_edge[0] == faces.give_node_list(face_index)[2]) & \
-				(node_in_edge[1] == faces.give_node_list(face_index)[3]):
-				edge_is_in_face = True
-			elif (node_in_edge[1] == faces.give_node_list(face_index)[2]) & \
-				(node_in_edge[0] == faces.give_node_list(face_index)[3]):
-				edge_is_in_face = True
-						
-			if (node_in_edge[0] == faces.give_node_list(face_index)[3]) & \
-				(node_in_edge[1] == faces.give_node_list(face_index)[0]):
-				edge_is_in_face = True
-			elif (node_in_edge[1] == faces.give_node_list(face_index)[3]) & \
-				(node_in_edge[0] == faces.give_node_list(face_index)[0]):
-				edge_is_in_face = True	
-						
-			if edge_is_in_face == True: shared_surface.append(face_index)
-			
-		edge_share_by_which_faces.append(shared_surface)
-		
-	return edge_share_by_which_faces
-	
-def find_neighbour_node(edges, faces, this_node):
-	"""This function is an auxilary function for subdivision
-	
-	In 4th - 6th scenarios in subdivision scheme, the neighbour vertices share 
-	one edge is set as ring 1 neighbours. The vertices share one face but no 
-	common edge are set as ring 2 neighbours. This function is based on edge 
-	linkage to work out the points set of ring 1 and ring 2 of a node with index 
-	`this_node`.
-	
+		node_valence: list, the number of faces sharing each node,
+		edge_valence: list, the number of faces sharing each edge."""
+
+	node_valence = [0]*n_node
+	edge_valence = [0]*edges.give_num_edges()
+	for face_index in range(faces.give_num_faces()):
+		for node_index in faces.give_node_list(face_index): node_valence[node_index] += 1
+		for edge_index in set(faces.give_edge_list(face_index)): edge_valence[edge_index] += 1
+
+	return (node_valence, edge_valence)
+
+def find_displacement(old_coor, new_coor, norm = 'max'):
+	"""The function to measure how far the existing vertices moved in one subdivision step.
+
+	Note:
+		Subdivision keeps the index of existing vertices, newly-generated vertices are
+		appended behind them, so only the first len(old_coor) nodes are compared.
+
 	Args:
-		edges: Edge object
-		faces: Face object
-		this_node: int, the index of the requeried point
-		
+		old_coor: list of coordinates [(x1,y1,z1),...] before subdivision,
+		new_coor: list of coordinates after subdivision,
+		norm: 'max' for the maximum displacement, 'rms' for the root mean square.
+
 	Returns:
-		ring1_node: list of the ring 1 neighbouring point index,
-		ring2_node: list of the ring 2 neighbouring point index."""
-	
-	# edges contatin this node
-	ring1_node = []
-	for edge_index in range(edges.give_num_edges()):
-		startnode_of_this_edge = edges.give_node(edge_index)[0]
-		endnode_of_this_edge = edges.give_node(edge_index)[1]
-		if endnode_of_this_edge == this_node:
-			ring1_node.append(startnode_of_this_edge)
-		if startnode_of_this_edge == this_node:
-			ring1_node.append(endnode_of_this_edge)	
-			
-	# faces contain this node
-	potential_ring2_node = []
-	for face_index in range(faces.give_num_faces()):		
-		for vertex_index in range(4):
-			if faces.give_node_list(face_index)[vertex_index] == this_node:
-				for vertex_index2 in range(4):
-					potential_ring2_node.append \
-						(faces.give_node_list(face_index)[vertex_index2])
-	
-	ring2_node = []			
-	for node in potential_ring2_node:
-		if (node not in (ring1_node + [this_node])) & (node not in ring2_node):
-			ring2_node.append(node)
+		displacement: float, the displacement of existing vertices under `norm`."""
+
+	if norm not in ('max', 'rms'):
+		raise ValueError('Unknown norm: ' + str(norm))
+
+	max_dist2 = 0.
+	sum_dist2 = 0.
+	for node_index in range(len(old_coor)):
+		old = old_coor[node_index]
+		new = new_coor[node_index]
+		dist2 = (new[0] - old[0])**2 + (new[1] - old[1])**2 + (new[2] - old[2])**2
+		sum_dist2 += dist2
+		if dist2 > max_dist2: max_dist2 = dist2
+
+	if len(old_coor) == 0: return 0.
+	if norm == 'max': return max_dist2**0.5
+	return (sum_dist2/len(old_coor))**0.5
+
+
+#: bytes taken by one node, edge and face of a mesh held in memory, and by one new edge
+#: in the temporary lookups while subdivision builds the next level; measured with 
+#: tracemalloc on 64-bit CPython
+BYTES_PER_NODE = 136
+BYTES_PER_EDGE = 100
+BYTES_PER_FACE = 240
+BYTES_PER_NEW_EDGE = 385
 
-	return (ring1_node, ring2_node)
+#: bytes per node, edge and face taken by the permutations a renumbered mesh keeps, and 
+#: by the temporary lists of geometry.reorder_mesh
+BYTES_PER_ORDER = 37
+BYTES_PER_REORDER = 85
 
+#: the estimates above are fitted to the Python heap without margin; the resident memory
+#: of the process is about 1.2 times of it, as freed memory is not given back, so 
+#: budgets are checked with headroom
+MEMORY_HEADROOM = 1.5
 
-def in_list(list_a, list_b):
-	"""The function to check whether a list of tuples contain a specific tuple.
+def predict_model_inf(model_inf, steps = 1):
+	"""The function to predict the size of a mesh after subdivision.
+
+	Note:
+		Each Catmull-Clark step on a quad mesh gives V' = V + F + E nodes, 
+		E' = 2E + 4F edges and F' = 4F faces.
 
 	Args:
-		list_a: the requeried tuple 
-		list_b: a list of tuples
-		
+		model_inf: (number of nodes, number of edges, number of faces), see Mesh.give_model_inf,
+		steps: int, the number of subdivisions.
+
 	Returns:
-		result: a bool vararible, which will be True if list_a is in list_b, 
-			otherwisem function will return False."""
-	
-	result = False
-	for sublist in list_b:
-		if (sublist[0] == list_a[0]) & (sublist[1] == list_a[1]):
-			result = True
-		if (sublist[1] == list_a[0]) & (sublist[0] == list_a[1]):
-			result = True
-	
-	return result
+		model_inf: (number of nodes, number of edges, number of faces) after `steps` subdivisions."""
+
+	n_node, n_edge, n_face = model_inf
+	for step in range(steps):
+		n_node, n_edge, n_face = (n_node + n_face + n_edge, 2*n_edge + 4*n_face, 4*n_face)
+
+	return (n_node, n_edge, n_face)
+
+def estimate_memory(model_inf, reorder = False):
+	"""The function to estimate the memory taken by a mesh of the given size.
+
+	Args:
+		model_inf: (number of nodes, number of edges, number of faces),
+		reorder: bool, True if the mesh is renumbered and keeps its permutations.
+
+	Returns:
+		memory: int, bytes."""
 
-def find_valence(node_index, faces):
-	"""The function to determine the valence of one requeried node.
+	memory = model_inf[0]*BYTES_PER_NODE + model_inf[1]*BYTES_PER_EDGE + model_inf[2]*BYTES_PER_FACE
+	if reorder: memory += sum(model_inf)*BYTES_PER_ORDER
+	return memory
+
+def estimate_peak_memory(model_inf, reorder = False):
+	"""The function to estimate the peak memory of subdividing a mesh of the given size once.
 
 	Note:
-		The valence of the node represents the total number of different 
-		faces which share this specific node.
+		While the next level is built, the current level, the next level and the 
+		lookups of the new edges are held at the same time. Renumbering the next 
+		level afterwards holds it twice, together with the temporary lists.
 
 	Args:
-		node_index: the index of requeried node,
-		faces: Face object, contains face connectivities.
-		
+		model_inf: (number of nodes, number of edges, number of faces) before subdivision,
+		reorder: bool, True if every level is renumbered by geometry.reorder_mesh.
+
 	Returns:
-		__valence: int, a scalar used for categorising the subdivision scenarios."""
-
-	__valence = 0
-	__n_faces = faces.give_num_faces()
-	for face_index in range(__n_faces):
-		for vertex_index in range(4):
-			this_vertex = faces.give_node_list(face_index)[vertex_index]
-			if this_vertex == node_index: __valence += 1
-	
-	return __valence
-	
+		memory: int, bytes."""
+
+	new_model_inf = predict_model_inf(model_inf)
+	memory = estimate_memory(model_inf, reorder) + estimate_memory(new_model_inf, reorder) + \
+		new_model_inf[1]*BYTES_PER_NEW_EDGE
+	if reorder:
+		memory = max(memory, 2*estimate_memory(new_model_inf, reorder) + sum(new_model_inf)*BYTES_PER_REORDER)
+	return memory
+
+def find_peak_rss():
+	"""The function to give the peak resident memory of this process so far.
+
+	Note:
+		This needs the module resource, which is only there on Unix.
+
+	Returns:
+		memory: int, bytes."""
+
+	import resource
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	#: kilobytes on Linux, bytes on macOS
+	if sys.platform == 'darwin': return peak
+	return peak*1024
 
 
 def main():
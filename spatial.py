@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""This file contains the bounding volume hierarchy for spatial queries on a refined surface.
+
+The hierarchy is built over the faces of a Mesh object of any level. Faces are sorted
+along the Z-order curve of their centres, and the sorted list is halved level by level,
+so building takes O(F log F). Nearest point, ray hit and box overlap queries then only
+visit the boxes near the query instead of every face. When a mesh is subdivided again
+after small changes of the control points, the connectivity stays the same and the
+boxes can be refitted without building the hierarchy again.
+
+Each quad is handled as the two triangles (x0,x1,x2) and (x0,x2,x3), as a refined
+quad is in general not planar.
+
+@author: Ge_Yin
+"""
+
+import heapq
+
+import geometry as geo
+
+class BVH:
+	"""Storing the boxes of a bounding volume hierarchy over the faces of a mesh.
+
+	Boxes are stored in flat lists, a parent box always comes before its children.
+	A leaf box holds the faces face_order[start:end]."""
+
+	def __init__(self, mesh, leaf_size = 4):
+		"""Builds the hierarchy.
+
+		Args:
+			mesh: Mesh object, the surface to be queried,
+			leaf_size: int, the largest number of faces in one leaf box."""
+
+		self.__leaf_size = leaf_size
+		self.__coor = mesh.give_nodes().give_coor()
+		self.__face_list = [mesh.give_faces().give_node_list(index) for index in range(mesh.give_model_inf()[2])]
+		n_face = len(self.__face_list)
+
+		face_box = [self.find_face_box(face_index) for face_index in range(n_face)]
+		centre = [tuple(0.5*(box[axis] + box[axis + 3]) for axis in range(3)) for box in face_box]
+		self.__face_order = geo.find_morton_order(centre)
+
+		self.__box = []
+		self.__left = []	#: index of the first child box, -1 for leaves
+		self.__right = []
+		self.__start = []
+		self.__end = []
+
+		if n_face == 0: return
+		stack = [(0, n_face, -1, False)]
+		while stack:
+			start, end, parent, is_right = stack.pop()
+			box_index = len(self.__box)
+			self.__box.append(None)
+			self.__left.append(-1)
+			self.__right.append(-1)
+			self.__start.append(start)
+			self.__end.append(end)
+			if parent >= 0:
+				if is_right: self.__right[parent] = box_index
+				else: self.__left[parent] = box_index
+
+			if end - start > leaf_size:
+				middle = (start + end)//2
+				stack.append((middle, end, box_index, True))
+				stack.append((start, middle, box_index, False))
+
+		self.refit_boxes(face_box)
+
+	def find_face_box(self, face_index):
+		"""Function to give the box of one face as [x_min, y_min, z_min, x_max, y_max, z_max]."""
+
+		points = [self.__coor[node] for node in self.__face_list[face_index]]
+		return [min(point[axis] for point in points) for axis in range(3)] + \
+			[max(point[axis] for point in points) for axis in range(3)]
+
+	def refit_boxes(self, face_box):
+		"""Function to recompute all boxes from the boxes of faces, children before parents."""
+
+		for box_index in range(len(self.__box) - 1, -1, -1):
+			left = self.__left[box_index]
+			if left < 0:
+				boxes = [face_box[self.__face_order[position]] for position in \
+					range(self.__start[box_index], self.__end[box_index])]
+			else: boxes = [self.__box[left], self.__box[self.__right[box_index]]]
+			self.__box[box_index] = [min(box[axis] for box in boxes) for axis in range(3)] + \
+				[max(box[axis] for box in boxes) for axis in range(3, 6)]
+
+	def refit(self, mesh):
+		"""Function to update the boxes to the coordinates of `mesh` without building again.
+
+		Args:
+			mesh: Mesh object with the same faces as the mesh the hierarchy was built
+				for, e.g. the same level subdivided from slightly moved control points."""
+
+		if mesh.give_model_inf()[2] != len(self.__face_list):
+			raise ValueError('Refit needs the same faces, got ' + str(mesh.give_model_inf()[2]) + \
+				' faces instead of ' + str(len(self.__face_list)))
+
+		self.__coor = mesh.give_nodes().give_coor()
+		self.refit_boxes([self.find_face_box(face_index) for face_index in range(len(self.__face_list))])
+
+	def give_num_boxes(self):
+		return len(self.__box)
+
+	def give_box(self, index):
+		return self.__box[index]
+
+	def find_triangles(self, face_index):
+		face = self.__face_list[face_index]
+		coor = self.__coor
+		return ((coor[face[0]], coor[face[1]], coor[face[2]]), (coor[face[0]], coor[face[2]], coor[face[3]]))
+
+	def closest_points(self, points):
+		"""Function to find the closest point on the surface for each query point.
+
+		Args:
+			points: list of coordinates [(x1,y1,z1),...].
+
+		Returns:
+			result: list of (face index, closest point, distance), one per query point."""
+
+		result = []
+		for point in points:
+			best = (None, None, float('inf'))
+			if not self.__box:
+				result.append(best)
+				continue
+
+			best_dist2 = float('inf')
+			heap = [(box_distance2(self.__box[0], point), 0)]
+			while heap:
+				dist2, box_index = heapq.heappop(heap)
+				if dist2 >= best_dist2: break
+
+				left = self.__left[box_index]
+				if left >= 0:
+					for child in (left, self.__right[box_index]):
+						child_dist2 = box_distance2(self.__box[child], point)
+						if child_dist2 < best_dist2: heapq.heappush(heap, (child_dist2, child))
+					continue
+
+				for position in range(self.__start[box_index], self.__end[box_index]):
+					face_index = self.__face_order[position]
+					for triangle in self.find_triangles(face_index):
+						closest = closest_point_on_triangle(point, triangle)
+						this_dist2 = sum((closest[axis] - point[axis])**2 for axis in range(3))
+						if this_dist2 < best_dist2:
+							best_dist2 = this_dist2
+							best = (face_index, closest, this_dist2**0.5)
+
+			result.append(best)
+
+		return result
+
+	def ray_hits(self, origins, directions, t_max = float('inf')):
+		"""Function to find the first face hit by each ray.
+
+		Args:
+			origins: list of coordinates of the ray origins,
+			directions: list of the ray directions, not necessarily normalised,
+			t_max: float, rays end at origin + t_max*direction.
+
+		Returns:
+			result: list of (face index, t), with (None, t_max) for rays missing the surface;
+				the hit point is origin + t*direction."""
+
+		result = []
+		for origin, direction in zip(origins, directions):
+			inverse = tuple(1./value if value != 0. else float('inf') for value in direction)
+			best = (None, t_max)
+			stack = []
+			if self.__box and (ray_box_entry(self.__box[0], origin, inverse, t_max) is not None): stack = [0]
+
+			while stack:
+				box_index = stack.pop()
+				left = self.__left[box_index]
+				if left >= 0:
+					entries = []
+					for child in (left, self.__right[box_index]):
+						entry = ray_box_entry(self.__box[child], origin, inverse, best[1])
+						if entry is not None: entries.append((entry, child))
+					#: visit the nearer child first, it is on top of the stack
+					for entry, child in sorted(entries, reverse = True): stack.append(child)
+					continue
+
+				for position in range(self.__start[box_index], self.__end[box_index]):
+					face_index = self.__face_order[position]
+					for triangle in self.find_triangles(face_index):
+						t = ray_triangle_hit(origin, direction, triangle)
+						if (t is not None) and (t < best[1]): best = (face_index, t)
+
+			result.append(best)
+
+		return result
+
+	def box_overlaps(self, boxes):
+		"""Function to find the faces overlapping each query box.
+
+		Note:
+			A face counts as overlapping if its own bounding box overlaps the query box,
+			so the result can hold faces near the box which do not touch it.
+
+		Args:
+			boxes: list of boxes [(x_min, y_min, z_min, x_max, y_max, z_max),...].
+
+		Returns:
+			result: list of lists of face indices, one list per query box."""
+
+		result = []
+		for query in boxes:
+			found = []
+			stack = [0] if self.__box else []
+			while stack:
+				box_index = stack.pop()
+				box = self.__box[box_index]
+				if not all((box[axis] <= query[axis + 3]) and (query[axis] <= box[axis + 3]) for axis in range(3)):
+					continue
+
+				left = self.__left[box_index]
+				if left >= 0:
+					stack.append(self.__right[box_index])
+					stack.append(left)
+					continue
+
+				for position in range(self.__start[box_index], self.__end[box_index]):
+					face_index = self.__face_order[position]
+					face_box = self.find_face_box(face_index)
+					if all((face_box[axis] <= query[axis + 3]) and (query[axis] <= face_box[axis + 3]) \
+						for axis in range(3)): found.append(face_index)
+
+			result.append(sorted(found))
+
+		return result
+
+
+def box_distance2(box, point):
+	"""Function to give the squared distance from a point to a box, 0 inside the box."""
+
+	dist2 = 0.
+	for axis in range(3):
+		if point[axis] < box[axis]: dist2 += (box[axis] - point[axis])**2
+		elif point[axis] > box[axis + 3]: dist2 += (point[axis] - box[axis + 3])**2
+	return dist2
+
+def ray_box_entry(box, origin, inverse, t_max):
+	"""Function to give the ray parameter where a ray enters a box (slab test).
+
+	Args:
+		box: [x_min, y_min, z_min, x_max, y_max, z_max],
+		origin: the ray origin, inverse: 1/direction per axis,
+		t_max: float, the end of the ray.
+
+	Returns:
+		t: float, or None if the ray misses the box before `t_max`."""
+
+	t_near, t_far = (0., t_max)
+	for axis in range(3):
+		if inverse[axis] == float('inf'):
+			if (origin[axis] < box[axis]) or (origin[axis] > box[axis + 3]): return None
+			continue
+		t0 = (box[axis] - origin[axis])*inverse[axis]
+		t1 = (box[axis + 3] - origin[axis])*inverse[axis]
+		if t0 > t1: t0, t1 = (t1, t0)
+		if t0 > t_near: t_near = t0
+		if t1 < t_far: t_far = t1
+		if t_near > t_far: return None
+	return t_near
+
+def ray_triangle_hit(origin, direction, triangle, epsilon = 1e-12):
+	"""Function to intersect a ray with a triangle (Moller-Trumbore).
+
+	Returns:
+		t: float, the ray parameter of the hit, or None if the ray misses."""
+
+	a, b, c = triangle
+	edge1 = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+	edge2 = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+	p = cross(direction, edge2)
+	det = dot(edge1, p)
+	if abs(det) < epsilon: return None
+
+	inv_det = 1./det
+	s = (origin[0] - a[0], origin[1] - a[1], origin[2] - a[2])
+	u = dot(s, p)*inv_det
+	if (u < 0.) or (u > 1.): return None
+	q = cross(s, edge1)
+	v = dot(direction, q)*inv_det
+	if (v < 0.) or (u + v > 1.): return None
+
+	t = dot(edge2, q)*inv_det
+	if t < 0.: return None
+	return t
+
+def closest_point_on_triangle(point, triangle):
+	"""Function to give the point of a triangle closest to `point`.
+
+	The regions of the triangle (vertices, edges, inside) are checked in turn,
+	see Ericson, Real-Time Collision Detection, 5.1.5."""
+
+	a, b, c = triangle
+	ab = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+	ac = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+	ap = (point[0] - a[0], point[1] - a[1], point[2] - a[2])
+	d1, d2 = (dot(ab, ap), dot(ac, ap))
+	if (d1 <= 0.) and (d2 <= 0.): return tuple(a)
+
+	bp = (point[0] - b[0], point[1] - b[1], point[2] - b[2])
+	d3, d4 = (dot(ab, bp), dot(ac, bp))
+	if (d3 >= 0.) and (d4 <= d3): return tuple(b)
+
+	vc = d1*d4 - d3*d2
+	if (vc <= 0.) and (d1 >= 0.) and (d3 <= 0.):
+		v = d1/(d1 - d3)
+		return tuple(a[axis] + v*ab[axis] for axis in range(3))
+
+	cp = (point[0] - c[0], point[1] - c[1], point[2] - c[2])
+	d5, d6 = (dot(ab, cp), dot(ac, cp))
+	if (d6 >= 0.) and (d5 <= d6): return tuple(c)
+
+	vb = d5*d2 - d1*d6
+	if (vb <= 0.) and (d2 >= 0.) and (d6 <= 0.):
+		w = d2/(d2 - d6)
+		return tuple(a[axis] + w*ac[axis] for axis in range(3))
+
+	va = d3*d6 - d5*d4
+	if (va <= 0.) and ((d4 - d3) >= 0.) and ((d5 - d6) >= 0.):
+		w = (d4 - d3)/((d4 - d3) + (d5 - d6))
+		return tuple(b[axis] + w*(c[axis] - b[axis]) for axis in range(3))
+
+	denom = va + vb + vc
+	if denom == 0.: return tuple(a)	#: degenerate triangle
+	v, w = (vb/denom, vc/denom)
+	return tuple(a[axis] + ab[axis]*v + ac[axis]*w for axis in range(3))
+
+def dot(u, v):
+	return u[0]*v[0] + u[1]*v[1] + u[2]*v[2]
+
+def cross(u, v):
+	return (u[1]*v[2] - u[2]*v[1], u[2]*v[0] - u[0]*v[2], u[0]*v[1] - u[1]*v[0])
+
+
+def main():
+	#class show case
+	print('Running spatial.py')
+
+if __name__ == '__main__':
+	main()
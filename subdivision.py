@@ -6,7 +6,8 @@ This file is part of the code to compute subdivision surfaces of input meshes.
 @author: Ge Yin
 """
 
-import helper
+import copy
+
 import geometry as geo
 
 def subdivision(mesh):
@@ -35,25 +36,38 @@ def subdivision(mesh):
 	#     |       |
 	# 1/4 o-------o 1/4
 
-	new_coor = mesh.give_nodes().give_coor()
+	n_node, n_edge, n_face = mesh.give_model_inf()
+
+	#: coordinates are double-buffered: the current level is only read from `old_coor`,
+	#: the next level is written into `new_coor`, which is preallocated with the known
+	#: size and laid out as existing nodes, face nodes, then edge nodes.
+	old_coor = mesh.give_nodes().give_coor()
+	new_coor = [None]*(n_node + n_face + n_edge)
+
+	#: classification carried by the mesh: the number of faces sharing each node and edge
+	node_valence = mesh.give_node_valence()
+	edge_valence = mesh.give_edge_valence()
 	
-	for face_index in range(mesh.give_model_inf()[2]): 
+	for face_index in range(n_face): 
 		new_x, new_y, new_z = (0, 0, 0)
 		for vertex_index in range(4):
-			mesh.give_faces()
 			node_index = mesh.give_faces().give_node_list(face_index)[vertex_index]
 
-			new_x += 0.25*mesh.give_nodes().give_coor(node_index)[0]
-			new_y += 0.25*mesh.give_nodes().give_coor(node_index)[1]
-			new_z += 0.25*mesh.give_nodes().give_coor(node_index)[2]
+			new_x += 0.25*old_coor[node_index][0]
+			new_y += 0.25*old_coor[node_index][1]
+			new_z += 0.25*old_coor[node_index][2]
 			
-		new_coor.append((new_x, new_y, new_z))
+		new_coor[n_node + face_index] = (new_x, new_y, new_z)
 		
 	# generating new nodes on the edge
-	# figure out one edge is shared by how many surfaces
-	edge_shared_by_faces_list = helper.find_edge_shared_by_which_faces(mesh.give_edges(), mesh.give_faces())
+	# figure out which surfaces share one edge, edges of valence 1 are on the boundary
+	edge_shared_by_faces_list = [[] for edge_index in range(n_edge)]
+	for face_index in range(n_face):
+		for edge_index in mesh.give_faces().give_edge_list(face_index):
+			if face_index not in edge_shared_by_faces_list[edge_index]:
+				edge_shared_by_faces_list[edge_index].append(face_index)
 	
-	for edge_index in range(mesh.give_model_inf()[1]):
+	for edge_index in range(n_edge):
 
 		new_x, new_y, new_z = (0., 0., 0.)
 		
@@ -62,16 +76,15 @@ def subdivision(mesh):
 	# 1/2 o---*---o 1/2              *: newly-generated vertices
 	# 
 
-		new_coor = mesh.give_nodes().give_coor()
-		if len(edge_shared_by_faces_list[edge_index]) == 1:	
+		if edge_valence[edge_index] == 1:	
 			new_x, new_y, new_z = (0., 0., 0.)
 			for vertex_index in range(2):
 				this_node = mesh.give_edges().give_node(edge_index)[vertex_index]
-				new_x += 0.5*mesh.give_nodes().give_coor()[this_node][0]
-				new_y += 0.5*mesh.give_nodes().give_coor()[this_node][1]
-				new_z += 0.5*mesh.give_nodes().give_coor()[this_node][2]
+				new_x += 0.5*old_coor[this_node][0]
+				new_y += 0.5*old_coor[this_node][1]
+				new_z += 0.5*old_coor[this_node][2]
 				
-			new_coor.append((new_x, new_y, new_z))
+			new_coor[n_node + n_face + edge_index] = (new_x, new_y, new_z)
 				
 	# 3. generate new node on interior edge
 	# 1/16 o-------o 1/16            o: existing vertices
@@ -86,9 +99,9 @@ def subdivision(mesh):
 			for vertex_index in range(2):
 				this_node = mesh.give_edges().give_node(edge_index)[vertex_index]
 				considered_node.append(this_node)
-				new_x += 3./8.*mesh.give_nodes().give_coor()[this_node][0]
-				new_y += 3./8.*mesh.give_nodes().give_coor()[this_node][1]
-				new_z += 3./8.*mesh.give_nodes().give_coor()[this_node][2]
+				new_x += 3./8.*old_coor[this_node][0]
+				new_y += 3./8.*old_coor[this_node][1]
+				new_z += 3./8.*old_coor[this_node][2]
 			
 			# faces contain this node
 			potential_node = []
@@ -102,16 +115,37 @@ def subdivision(mesh):
 					outer_node.append(node)
 					
 			for vertex_index in outer_node:
-				new_x += 1./16.*mesh.give_nodes().give_coor()[vertex_index][0]
-				new_y += 1./16.*mesh.give_nodes().give_coor()[vertex_index][1]
-				new_z += 1./16.*mesh.give_nodes().give_coor()[vertex_index][2]
+				new_x += 1./16.*old_coor[vertex_index][0]
+				new_y += 1./16.*old_coor[vertex_index][1]
+				new_z += 1./16.*old_coor[vertex_index][2]
 			
-			new_coor.append((new_x, new_y, new_z))
+			new_coor[n_node + n_face + edge_index] = (new_x, new_y, new_z)
 
 	# update the links of edges and surfaces
+	# the classification of the next level follows from this level: halves of an edge 
+	# keep its valence, edges inside a face have valence 2; existing nodes keep their
+	# valence, face nodes have valence 4 and edge nodes twice the valence of their edge.
 	new_edge_list = []
 	new_face_list = []
-	for face_index in range(mesh.give_model_inf()[2]):
+	new_edge_valence = []
+	new_node_valence = node_valence + [4]*n_face + [2*valence for valence in edge_valence]
+
+	#: ring 1 (sharing an edge) and ring 2 (sharing a face but no edge) neighbours of
+	#: existing nodes on the next level, recorded while the new links are generated
+	ring1_of_node = [[] for node_index in range(n_node)]
+	ring2_of_node = [[] for node_index in range(n_node)]
+
+	new_edge_of_pair = {}
+	def add_edge(start_node, end_node, valence):
+		pair = (min(start_node, end_node), max(start_node, end_node))
+		if pair in new_edge_of_pair: return
+		new_edge_of_pair[pair] = len(new_edge_list)
+		new_edge_list.append((start_node, end_node))
+		new_edge_valence.append(valence)
+		if end_node < n_node: ring1_of_node[end_node].append(start_node)
+		if start_node < n_node: ring1_of_node[start_node].append(end_node)
+
+	for face_index in range(n_face):
 		old_node0 = mesh.give_faces().give_node_list(face_index)[0]
 		old_node1 = mesh.give_faces().give_node_list(face_index)[1]
 		old_node2 = mesh.give_faces().give_node_list(face_index)[2]
@@ -122,52 +156,44 @@ def subdivision(mesh):
 		old_edge2 = mesh.give_faces().give_edge_list(face_index)[2]
 		old_edge3 = mesh.give_faces().give_edge_list(face_index)[3]
 		
-		new_node4 = old_edge0 + mesh.give_model_inf()[0] + mesh.give_model_inf()[2] 
-		new_node5 = old_edge1 + mesh.give_model_inf()[0] + mesh.give_model_inf()[2]
-		new_node6 = old_edge2 + mesh.give_model_inf()[0] + mesh.give_model_inf()[2]
-		new_node7 = old_edge3 + mesh.give_model_inf()[0] + mesh.give_model_inf()[2]	
-		new_node8 = mesh.give_model_inf()[0] + face_index
+		new_node4 = old_edge0 + n_node + n_face 
+		new_node5 = old_edge1 + n_node + n_face
+		new_node6 = old_edge2 + n_node + n_face
+		new_node7 = old_edge3 + n_node + n_face	
+		new_node8 = n_node + face_index
 		
-		if helper.in_list((old_node0, new_node4), new_edge_list) == False: 
-			new_edge_list.append((old_node0, new_node4))
-		if helper.in_list((new_node4, new_node8), new_edge_list) == False: 
-			new_edge_list.append((new_node4, new_node8))
-		if helper.in_list((new_node8, new_node7), new_edge_list) == False: 
-			new_edge_list.append((new_node8, new_node7))
-		if helper.in_list((new_node7, old_node0), new_edge_list) == False: 
-			new_edge_list.append((new_node7, old_node0))
-		if helper.in_list((new_node4, old_node1), new_edge_list) == False: 
-			new_edge_list.append((new_node4, old_node1))
-		if helper.in_list((old_node1, new_node5), new_edge_list) == False: 
-			new_edge_list.append((old_node1, new_node5))
-		if helper.in_list((new_node5, new_node8), new_edge_list) == False: 
-			new_edge_list.append((new_node5, new_node8))
-		if helper.in_list((new_node7, old_node3), new_edge_list) == False: 
-			new_edge_list.append((new_node7, old_node3))
-		if helper.in_list((old_node3, new_node6), new_edge_list) == False: 
-			new_edge_list.append((old_node3, new_node6))
-		if helper.in_list((new_node6, new_node8), new_edge_list) == False: 
-			new_edge_list.append((new_node6, new_node8))
-		if helper.in_list((new_node6, old_node2), new_edge_list) == False: 
-			new_edge_list.append((new_node6, old_node2))
-		if helper.in_list((old_node2, new_node5), new_edge_list) == False: 
-			new_edge_list.append((old_node2, new_node5))
+		add_edge(old_node0, new_node4, edge_valence[old_edge0])
+		add_edge(new_node4, new_node8, 2)
+		add_edge(new_node8, new_node7, 2)
+		add_edge(new_node7, old_node0, edge_valence[old_edge3])
+		add_edge(new_node4, old_node1, edge_valence[old_edge0])
+		add_edge(old_node1, new_node5, edge_valence[old_edge1])
+		add_edge(new_node5, new_node8, 2)
+		add_edge(new_node7, old_node3, edge_valence[old_edge3])
+		add_edge(old_node3, new_node6, edge_valence[old_edge2])
+		add_edge(new_node6, new_node8, 2)
+		add_edge(new_node6, old_node2, edge_valence[old_edge2])
+		add_edge(old_node2, new_node5, edge_valence[old_edge1])
 	
 		new_face_list.append((old_node0, new_node4, new_node8, new_node7))
 		new_face_list.append((new_node4, old_node1, new_node5, new_node8))
 		new_face_list.append((new_node7, new_node8, new_node6, old_node3))
 		new_face_list.append((new_node8, new_node5, old_node2, new_node6))
+
+		for old_node in (old_node0, old_node1, old_node2, old_node3):
+			if new_node8 not in ring2_of_node[old_node]: ring2_of_node[old_node].append(new_node8)
 		
 	new_edges = geo.Edge(new_edge_list)
 	
 	new_faces = geo.Face(new_face_list, new_edges)
 		
 	# update existing nodes	
-	for node_index in range(mesh.give_model_inf()[0]):
+	for node_index in range(n_node):
 		
-		ring1, ring2 = helper.find_neighbour_node(new_edges, new_faces, node_index)
-		valence = helper.find_valence(node_index, new_faces) 
-		#: valence: the number of faces sharing on specific edge
+		ring1 = ring1_of_node[node_index]
+		ring2 = ring2_of_node[node_index]
+		valence = node_valence[node_index]
+		#: valence: the number of faces sharing on specific node
 
 	# 4. update existing corner vertex
 	# 2/4  @---* 1/4              *: newly-generated vertices
@@ -180,18 +206,18 @@ def subdivision(mesh):
 			new_x, new_y, new_z = (0, 0, 0)
 			print
 			for node_in_ring1 in ring1:
-				new_x += 1./4.*mesh.give_nodes().give_coor()[node_in_ring1][0]
-				new_y += 1./4.*mesh.give_nodes().give_coor()[node_in_ring1][1]
-				new_z += 1./4.*mesh.give_nodes().give_coor()[node_in_ring1][2]
+				new_x += 1./4.*new_coor[node_in_ring1][0]
+				new_y += 1./4.*new_coor[node_in_ring1][1]
+				new_z += 1./4.*new_coor[node_in_ring1][2]
 
 			for node_in_ring2 in ring2:
-				new_x += 0.*mesh.give_nodes().give_coor()[node_in_ring2][0]
-				new_y += 0.*mesh.give_nodes().give_coor()[node_in_ring2][1]
-				new_z += 0.*mesh.give_nodes().give_coor()[node_in_ring2][2]
+				new_x += 0.*new_coor[node_in_ring2][0]
+				new_y += 0.*new_coor[node_in_ring2][1]
+				new_z += 0.*new_coor[node_in_ring2][2]
 				
-			new_x += 2./4.*mesh.give_nodes().give_coor()[node_index][0]
-			new_y += 2./4.*mesh.give_nodes().give_coor()[node_index][1]
-			new_z += 2./4.*mesh.give_nodes().give_coor()[node_index][2]
+			new_x += 2./4.*old_coor[node_index][0]
+			new_y += 2./4.*old_coor[node_index][1]
+			new_z += 2./4.*old_coor[node_index][2]
 
 	# 5. update existing boundary joint vertex
 	#         3/4
@@ -203,14 +229,14 @@ def subdivision(mesh):
 			
 			new_x, new_y, new_z = (0, 0, 0)
 			for node_in_ring1 in ring1:
-				if helper.find_valence(node_in_ring1, new_faces) <= 2: 
-					new_x += 1./8.*mesh.give_nodes().give_coor()[node_in_ring1][0]
-					new_y += 1./8.*mesh.give_nodes().give_coor()[node_in_ring1][1]
-					new_z += 1./8.*mesh.give_nodes().give_coor()[node_in_ring1][2]
+				if new_node_valence[node_in_ring1] <= 2: 
+					new_x += 1./8.*new_coor[node_in_ring1][0]
+					new_y += 1./8.*new_coor[node_in_ring1][1]
+					new_z += 1./8.*new_coor[node_in_ring1][2]
 					
-			new_x += 3./4.*mesh.give_nodes().give_coor()[node_index][0]
-			new_y += 3./4.*mesh.give_nodes().give_coor()[node_index][1]
-			new_z += 3./4.*mesh.give_nodes().give_coor()[node_index][2]
+			new_x += 3./4.*old_coor[node_index][0]
+			new_y += 3./4.*old_coor[node_index][1]
+			new_z += 3./4.*old_coor[node_index][2]
 	
 	# 6. update new node on interior edge
 	#           * r/k
@@ -229,28 +255,323 @@ def subdivision(mesh):
 			beta = 3./2./valence
 			gamma = 1./4./valence
 			for node_in_ring1 in ring1:
-				new_x += beta/valence*mesh.give_nodes().give_coor()[node_in_ring1][0]
-				new_y += beta/valence*mesh.give_nodes().give_coor()[node_in_ring1][1]
-				new_z += beta/valence*mesh.give_nodes().give_coor()[node_in_ring1][2]
+				new_x += beta/valence*new_coor[node_in_ring1][0]
+				new_y += beta/valence*new_coor[node_in_ring1][1]
+				new_z += beta/valence*new_coor[node_in_ring1][2]
 			
 			for node_in_ring2 in ring2:
-				new_x += gamma/valence*mesh.give_nodes().give_coor()[node_in_ring2][0]
-				new_y += gamma/valence*mesh.give_nodes().give_coor()[node_in_ring2][1]
-				new_z += gamma/valence*mesh.give_nodes().give_coor()[node_in_ring2][2]
+				new_x += gamma/valence*new_coor[node_in_ring2][0]
+				new_y += gamma/valence*new_coor[node_in_ring2][1]
+				new_z += gamma/valence*new_coor[node_in_ring2][2]
 			
-			new_x += (1. - beta - gamma)*mesh.give_nodes().give_coor()[node_index][0]
-			new_y += (1. - beta - gamma)*mesh.give_nodes().give_coor()[node_index][1]
-			new_z += (1. - beta - gamma)*mesh.give_nodes().give_coor()[node_index][2]
+			new_x += (1. - beta - gamma)*old_coor[node_index][0]
+			new_y += (1. - beta - gamma)*old_coor[node_index][1]
+			new_z += (1. - beta - gamma)*old_coor[node_index][2]
 		
 		new_coor[node_index] = (new_x, new_y, new_z)
 	
 	new_nodes = geo.Node(new_coor)
+
+	#: a renumbered mesh keeps the map to the unrenumbered order across levels
+	order = None
+	if mesh.give_node_order() is not None: order = find_subdivision_order(mesh, new_edge_list)
 	
-	mesh.update(new_nodes, new_edges, new_faces)
+	mesh.update(new_nodes, new_edges, new_faces, new_node_valence, new_edge_valence, order)
 	
 	# return new_mesh
 	return mesh
 
+def find_subdivision_order(mesh, new_edge_list):
+	"""Function to carry the order of a renumbered mesh over to its next level.
+
+	Note:
+		Subdivision numbers the new level from the current numbering. If the mesh was
+		renumbered by geometry.reorder_mesh, this function gives the index each new 
+		node, edge and face would have if no level had been renumbered: existing 
+		nodes, face nodes and edge nodes follow the order of their source, face k of 
+		a face comes 4th, and edges are numbered where they first appear when the 
+		faces are visited in their unrenumbered order.
+
+	Args:
+		mesh: Mesh object before subdivision, with node, edge and face orders,
+		new_edge_list: list of pairs of nodes of the next level.
+
+	Returns:
+		order: (node_order, edge_order, face_order) of the next level, see Mesh.update."""
+
+	n_node, n_edge, n_face = mesh.give_model_inf()
+	node_order = mesh.give_node_order()
+	edge_order = mesh.give_edge_order()
+	face_order = mesh.give_face_order()
+	faces = mesh.give_faces()
+
+	new_node_order = node_order + [n_node + index for index in face_order] + \
+		[n_node + n_face + index for index in edge_order]
+	new_face_order = [4*face_order[face_index] + corner for face_index in range(n_face) for corner in range(4)]
+
+	face_of_order = [0]*n_face
+	for face_index in range(n_face): face_of_order[face_order[face_index]] = face_index
+
+	#: the edges of each face are visited in the order subdivision adds them
+	edge_of_pair = {}
+	for face_index in face_of_order:
+		old_node0, old_node1, old_node2, old_node3 = faces.give_node_list(face_index)
+		new_node4, new_node5, new_node6, new_node7 = \
+			(old_edge + n_node + n_face for old_edge in faces.give_edge_list(face_index))
+		new_node8 = n_node + face_index
+		for pair in ((old_node0, new_node4), (new_node4, new_node8), (new_node8, new_node7), \
+			(new_node7, old_node0), (new_node4, old_node1), (old_node1, new_node5), \
+			(new_node5, new_node8), (new_node7, old_node3), (old_node3, new_node6), \
+			(new_node6, new_node8), (new_node6, old_node2), (old_node2, new_node5)):
+			pair = (min(pair), max(pair))
+			if pair not in edge_of_pair: edge_of_pair[pair] = len(edge_of_pair)
+
+	new_edge_order = [edge_of_pair[(min(edge), max(edge))] for edge in new_edge_list]
+
+	return (new_node_order, new_edge_order, new_face_order)
+
+def patch_subdivision(patches):
+	"""Function to subdivide a PatchMesh once, using fixed stencils on the regular grids.
+
+	Every node inside a grid or on the strip of a base edge is regular, so the rules 
+	of function subdivision reduce to fixed weights on grid neighbours:
+	face nodes 1/4 of the cell, edge nodes 3/8 of the ends and 1/16 of the four
+	nodes beside, inner nodes 9/16 of themselves, 3/32 of the four new edge nodes 
+	and 1/64 of the four new face nodes. Only the base nodes use the general rules 
+	with their own valence. Strips are computed once per base edge and copied into 
+	the grids on both sides.
+
+	Args:
+		patches: PatchMesh object, updated to the next level.
+
+	Returns:
+		patches: PatchMesh object."""
+
+	n = patches.give_num_segments()
+	base = patches.give_base()
+	n_node, n_edge, n_face = base.give_model_inf()
+	grids = patches.give_grid()
+	side_node = ((lambda t: (t, 0)), (lambda t: (n, t)), (lambda t: (n - t, n)), (lambda t: (0, n - t)))
+	side_inner = ((lambda t: (t, 1)), (lambda t: (n - 1, t)), (lambda t: (n - t, n - 1)), (lambda t: (1, n - t)))
+	side_cell = ((lambda s: (s, 0)), (lambda s: (n - 1, s)), (lambda s: (n - s - 1, n - 1)), (lambda s: (0, n - s - 1)))
+
+	# 1. face nodes and edge nodes inside each grid
+	face_points = []
+	edge_u_points = []	#: edge_u_points[i][j-1]: edge from grid[i][j] to grid[i+1][j], 0 < j < n
+	edge_v_points = []	#: edge_v_points[i-1][j]: edge from grid[i][j] to grid[i][j+1], 0 < i < n
+	for grid in grids:
+		face_point = []
+		for i in range(n):
+			row0, row1 = (grid[i], grid[i + 1])
+			face_point.append([(0.25*(row0[j][0] + row1[j][0] + row1[j + 1][0] + row0[j + 1][0]), \
+				0.25*(row0[j][1] + row1[j][1] + row1[j + 1][1] + row0[j + 1][1]), \
+				0.25*(row0[j][2] + row1[j][2] + row1[j + 1][2] + row0[j + 1][2])) for j in range(n)])
+		face_points.append(face_point)
+
+		edge_u_point = []
+		for i in range(n):
+			row0, row1 = (grid[i], grid[i + 1])
+			edge_u_point.append([tuple(3./8.*(row0[j][axis] + row1[j][axis]) + 1./16.*(row0[j - 1][axis] + \
+				row1[j - 1][axis] + row0[j + 1][axis] + row1[j + 1][axis])  for axis in range(3)) for j in range(1, n)])
+		edge_u_points.append(edge_u_point)
+
+		edge_v_point = []
+		for i in range(1, n):
+			row_m, row0, row_p = (grid[i - 1], grid[i], grid[i + 1])
+			edge_v_point.append([tuple(3./8.*(row0[j][axis] + row0[j + 1][axis]) + 1./16.*(row_m[j][axis] + \
+				row_m[j + 1][axis] + row_p[j][axis] + row_p[j + 1][axis]) for axis in range(3)) for j in range(n)])
+		edge_v_points.append(edge_v_point)
+
+	# 2. edge nodes on the strips along base edges, ordered from the first node of the edge
+	strip_points = []
+	for edge_index in range(n_edge):
+		sides = patches.give_edge_sides(edge_index)
+		strip_point = []
+		if sides:
+			face_index, side = sides[0]
+			forward = patches.is_forward(edge_index, face_index, side)
+			strip = [grids[face_index][i][j] for i, j in \
+				[side_node[side](t if forward else n - t) for t in range(n + 1)]]
+
+			for k in range(n):
+				if len(sides) == 1:
+					strip_point.append(tuple(0.5*strip[k][axis] + 0.5*strip[k + 1][axis] for axis in range(3)))
+					continue
+
+				outer = []
+				for face_index, side in sides:
+					forward = patches.is_forward(edge_index, face_index, side)
+					for t in ((k, k + 1) if forward else (n - k, n - k - 1)):
+						i, j = side_inner[side](t)
+						outer.append(grids[face_index][i][j])
+				strip_point.append(tuple(3./8.*(strip[k][axis] + strip[k + 1][axis]) + \
+					1./16.*sum(point[axis] for point in outer) for axis in range(3)))
+		strip_points.append(strip_point)
+
+	# 3. existing nodes on the strips, regular with valence 2 (boundary) or 4
+	strip_nodes = []
+	for edge_index in range(n_edge):
+		sides = patches.give_edge_sides(edge_index)
+		strip_node = []
+		if sides:
+			face_index, side = sides[0]
+			forward = patches.is_forward(edge_index, face_index, side)
+			strip = [grids[face_index][i][j] for i, j in \
+				[side_node[side](t if forward else n - t) for t in range(n + 1)]]
+			edge_point = strip_points[edge_index]
+			valence = 2*len(sides)
+
+			for k in range(1, n):
+				if valence == 2:
+					strip_node.append(tuple(1./8.*(edge_point[k - 1][axis] + edge_point[k][axis]) + \
+						3./4.*strip[k][axis] for axis in range(3)))
+					continue
+
+				ring1 = [edge_point[k - 1], edge_point[k]]
+				ring2 = []
+				for face_index, side in sides:
+					forward = patches.is_forward(edge_index, face_index, side)
+					t = k if forward else n - k
+					i, j = side_node[side](t)
+					if side == 0: ring1.append(edge_v_points[face_index][i - 1][0])
+					elif side == 1: ring1.append(edge_u_points[face_index][n - 1][j - 1])
+					elif side == 2: ring1.append(edge_v_points[face_index][i - 1][n - 1])
+					else: ring1.append(edge_u_points[face_index][0][j - 1])
+					for cell_i, cell_j in (side_cell[side](t - 1), side_cell[side](t)):
+						ring2.append(face_points[face_index][cell_i][cell_j])
+
+				beta = 3./2./valence
+				gamma = 1./4./valence
+				strip_node.append(tuple(beta/valence*sum(point[axis] for point in ring1) + \
+					gamma/valence*sum(point[axis] for point in ring2) + \
+					(1. - beta - gamma)*strip[k][axis] for axis in range(3)))
+		strip_nodes.append(strip_node)
+
+	# 4. base nodes, the only nodes which can be extraordinary, with the rules of function subdivision
+	corner_nodes = [None]*n_node
+	for node_index in range(n_node):
+		corners = patches.give_node_corners(node_index)
+		if not corners: continue
+
+		face_index, corner = corners[0]
+		this_point = grids[face_index][(0, n, n, 0)[corner]][(0, 0, n, n)[corner]]
+		valence = len(corners)
+
+		ring1 = []
+		boundary_ring1 = []
+		for edge_index in patches.give_node_edges(node_index):
+			if not strip_points[edge_index]: continue
+			if base.give_edges().give_node(edge_index)[0] == node_index: point = strip_points[edge_index][0]
+			else: point = strip_points[edge_index][n - 1]
+			ring1.append(point)
+			if len(patches.give_edge_sides(edge_index)) == 1: boundary_ring1.append(point)
+		ring2 = [face_points[face_index][(0, n - 1, n - 1, 0)[corner]][(0, 0, n - 1, n - 1)[corner]] \
+			for face_index, corner in corners]
+
+		if valence == 1:
+			corner_nodes[node_index] = tuple(1./4.*sum(point[axis] for point in ring1) + \
+				2./4.*this_point[axis] for axis in range(3))
+		elif valence == 2:
+			corner_nodes[node_index] = tuple(1./8.*sum(point[axis] for point in boundary_ring1) + \
+				3./4.*this_point[axis] for axis in range(3))
+		else:
+			beta = 3./2./valence
+			gamma = 1./4./valence
+			corner_nodes[node_index] = tuple(beta/valence*sum(point[axis] for point in ring1) + \
+				gamma/valence*sum(point[axis] for point in ring2) + \
+				(1. - beta - gamma)*this_point[axis] for axis in range(3))
+
+	# 5. inner nodes of each grid and the new grids of size 2n+1
+	new_n = 2*n
+	new_grids = []
+	for face_index in range(n_face):
+		grid = grids[face_index]
+		face_point = face_points[face_index]
+		edge_u_point = edge_u_points[face_index]
+		edge_v_point = edge_v_points[face_index]
+		new_grid = [[None]*(new_n + 1) for i in range(new_n + 1)]
+
+		for i in range(n):
+			new_row = new_grid[2*i + 1]
+			for j in range(n): new_row[2*j + 1] = face_point[i][j]
+			for j in range(1, n): new_row[2*j] = edge_u_point[i][j - 1]
+		for i in range(1, n):
+			new_row = new_grid[2*i]
+			for j in range(n): new_row[2*j + 1] = edge_v_point[i - 1][j]
+
+			row = grid[i]
+			for j in range(1, n):
+				ring1 = (edge_u_point[i - 1][j - 1], edge_u_point[i][j - 1], edge_v_point[i - 1][j - 1], edge_v_point[i - 1][j])
+				ring2 = (face_point[i - 1][j - 1], face_point[i][j - 1], face_point[i - 1][j], face_point[i][j])
+				new_row[2*j] = tuple(3./32.*(ring1[0][axis] + ring1[1][axis] + ring1[2][axis] + ring1[3][axis]) + \
+					1./64.*(ring2[0][axis] + ring2[1][axis] + ring2[2][axis] + ring2[3][axis]) + \
+					9./16.*row[j][axis] for axis in range(3))
+
+		#: the shared strips, their ends are the base nodes
+		for side in range(4):
+			edge_index = base.give_faces().give_edge_list(face_index)[side]
+			start_node, end_node = base.give_edges().give_node(edge_index)
+			new_strip = [corner_nodes[start_node]]
+			for k in range(n):
+				if k > 0: new_strip.append(strip_nodes[edge_index][k - 1])
+				new_strip.append(strip_points[edge_index][k])
+			new_strip.append(corner_nodes[end_node])
+
+			forward = patches.is_forward(edge_index, face_index, side)
+			for t in range(new_n + 1):
+				if side == 0: i, j = (t, 0)
+				elif side == 1: i, j = (new_n, t)
+				elif side == 2: i, j = (new_n - t, new_n)
+				else: i, j = (0, new_n - t)
+				new_grid[i][j] = new_strip[t if forward else new_n - t]
+
+		new_grids.append(new_grid)
+
+	patches.update(new_grids)
+	return patches
+
+
+def subdivision_levels(mesh, maxstep = None, keep = False, patch = False):
+	"""Generator to go through the subdivision levels of a mesh one by one.
+
+	Each level is computed only when it is asked for, so a consumer (writing files, 
+	checking convergence, previews) can stop at any point without deciding the 
+	number of levels up front.
+
+	Args:
+		mesh: Mesh object, yielded first as level 0,
+		maxstep: int, the number of subdivisions, or None to go on until the consumer stops,
+		keep: bool, if False the same Mesh object is updated from level to level, so 
+			the previous level is released once nothing else refers to it; if True 
+			every level is a separate Mesh object which stays valid,
+		patch: bool, if True the levels are refined as a PatchMesh by function 
+			patch_subdivision, and each level is assembled into a new Mesh object.
+
+	Yields:
+		mesh: Mesh object, the next level."""
+
+	if patch: patches = geo.PatchMesh(mesh)
+
+	level = mesh
+	if keep: level = copy.copy(level)
+	yield level
+
+	step = 0
+	if patch:
+		while (maxstep is None) or (step < maxstep):
+			patch_subdivision(patches)
+			step += 1
+			yield patches.to_mesh()
+		return
+
+	while (maxstep is None) or (step < maxstep):
+		#: subdivision replaces nodes, edges and faces of a mesh instead of changing 
+		#  them, so a shallow copy is enough to keep the previous level
+		if keep: level = copy.copy(level)
+		subdivision(level)
+		step += 1
+		yield level
+
 	
 	
 def main():
@@ -9,13 +9,16 @@ Modules:
 	visualisation: post-process for the refined shpae. Result can be visualised using
 		matplot or as a ouput model *.vtu output file.
 	helper: provides auxilary functions for other modules
+	worker: runs subdivision jobs in a long-running process, keeping models in memory
+	spatial: bounding volume hierarchy for nearest point, ray and box queries on a level
 
 To use:
 	Details can be seen in option `-h` or `--help`
 	If test the file please type `test.py -p` to run subdivision for a 2d square, 
 	or type `test.py -i 3d_example.dat -p` to run subdivision for a 3d square.
 	Two test models (2d and 3d) are prepared, which are put in ``model``, also code 
-	will look for model file in ``model`` folder.
+	will look for model file in ``model`` folder. Quad meshes in *.obj or *.ply files
+	can be given as input as well, e.g. `test.py -i 3d_example.obj`.
 	Nodes and edges can be seen by switch on `-p` or `--plot`
 
 @author: Ge_Yin
@@ -24,8 +27,10 @@ To use:
 import sys, getopt, time
 
 from geometry import Mesh as mesh
-from subdivision import subdivision
+from geometry import reorder_mesh
+from subdivision import subdivision_levels
 import visualisation as view
+import helper
 
 def main(argv):
 	"""Function to generate subdivision surfaces
@@ -35,6 +40,21 @@ def main(argv):
 		`-i <inputfile>` or `--infile=<inputfile>`: give input mesh file,
 		`-o <outputfile> or -outfile=<outputfile>`: give directory to save result
 		`-m <maxstep> or `--maxstep=<maxstep>`: give the number of iterations
+		`-t <tolerance>` or `--tol=<tolerance>`: stop once the existing vertices move less 
+			than `tolerance` in one iteration, `maxstep` is then the upper limit (default 10)
+		`--norm=<max|rms>`: measure the displacement by its maximum (default) or rms value
+		`-f <maxface>` or `--maxface=<maxface>`: stop before a level exceeds `maxface` faces
+		`-r <rcm|morton>` or `--reorder=<rcm|morton>`: renumber every level for locality, 
+			the index before renumbering is written as `SubdivisionIndex` in the output
+		`--patch`: refine the grid inside each base face with fixed stencils, 
+			only base nodes use the general rules
+		`-n <pieces>` or `--pieces=<pieces>`: write each level as `pieces` vtu files in 
+			parallel and a pvtu file listing them
+		`-w <tolerance>` or `--weld=<tolerance>`: weld nodes closer than `tolerance` on
+			loading and remove duplicate edges and faces
+		`-b <membudget>` or `--membudget=<membudget>`: stop before the resident memory of 
+			the process is predicted to exceed `membudget` MB in the next level, 
+			predicted and actual peaks are reported
 		`-h` or `--help`: call help
 		`-p` or `--plot`: option to plot points and edges"""
 		
@@ -42,11 +62,20 @@ def main(argv):
 	inputfile = ""
 	outputfile = ""
 	maxstep = -1
+	tolerance = None
+	norm = 'max'
+	maxface = None
+	reorder = None
+	membudget = None
+	weld = None
+	patch = False
+	pieces = 1
 	plot = False
 
 	try:
-		opts, args = getopt.getopt(argv, "hi:o:pm:" ,\
-			["infile=", "outfile=", "maxstep=","help","plot"])
+		opts, args = getopt.getopt(argv, "hi:o:pm:t:f:r:b:w:n:" ,\
+			["infile=", "outfile=", "maxstep=","help","plot","tol=","norm=","maxface=","reorder=",\
+			"membudget=","weld=","patch","pieces="])
 	except getopt.GetoptError:
 		print('Error: please try test.py -i <inputfile> -o <outputfile> -m <maxstep>')
 		print('   or: test.py --infile=<inputfile> --outfile=<outputfile> --maxstep=<maxstep>')
@@ -56,6 +85,12 @@ def main(argv):
 		if opt in ("-h", "--help"):
 			print('\ntest.py -i <inputfile> -o <outputfile> -max <maxstep>')
 			print('or: test.py --infile=<inputfile> --outfile=<outputfile> --maxstep=<maxst>')
+			print('\nTo stop early: -t <tolerance> --norm=<max|rms> -f <maxface>')
+			print('To renumber nodes and faces for locality: -r <rcm|morton>')
+			print('To limit the memory: -b <membudget in MB>')
+			print('To weld coincident nodes on loading: -w <tolerance>')
+			print('To refine regular grids with fixed stencils: --patch')
+			print('To write each level in parallel pieces: -n <pieces>')
 			print('\nTo plot results: -p (matplotlib is needed for plotting)\n')
             
 			sys.exit()
@@ -83,6 +118,38 @@ def main(argv):
 		elif opt in ("-m", "--maxstep"):
 			maxstep = int(arg)
 
+		elif opt in ("-t", "--tol"):
+			tolerance = float(arg)
+
+		elif opt == "--norm":
+			if arg not in ('max', 'rms'):
+				print('!Error: Unknown norm: ', arg)
+				print("        Try 'max' or 'rms'\n")
+				sys.exit()
+			norm = arg
+
+		elif opt in ("-f", "--maxface"):
+			maxface = int(arg)
+
+		elif opt in ("-r", "--reorder"):
+			if arg not in ('rcm', 'morton'):
+				print('!Error: Unknown reordering: ', arg)
+				print("        Try 'rcm' or 'morton'\n")
+				sys.exit()
+			reorder = arg
+
+		elif opt in ("-b", "--membudget"):
+			membudget = float(arg)
+
+		elif opt in ("-w", "--weld"):
+			weld = float(arg)
+
+		elif opt == "--patch":
+			patch = True
+
+		elif opt in ("-n", "--pieces"):
+			pieces = int(arg)
+
 		elif opt in("-p", "--plot"):
 			plot = True
 			
@@ -93,7 +160,8 @@ def main(argv):
 	if not outputfile:
 		outputfile = 'result'
 	if maxstep < 0: 
-		maxstep = 3
+		if tolerance is None: maxstep = 3
+		else: maxstep = 10
 		missinginput += 1
 	
 	if missinginput > 0: 
@@ -103,6 +171,13 @@ def main(argv):
 	print (' -> Input file:  ', inputfile)
 	print (' -> Output file: ', outputfile)
 	print (' -> Max Step:    ', maxstep)
+	if tolerance is not None: print(' -> Tolerance:   ', tolerance, '(' + norm + ')')
+	if maxface is not None: print(' -> Max Face:    ', maxface)
+	if reorder is not None: print(' -> Reordering:  ', reorder)
+	if membudget is not None: print(' -> Mem. Budget: ', membudget, 'MB')
+	if weld is not None: print(' -> Weld:        ', weld)
+	if patch: print(' -> Patch-based refinement of regular grids')
+	if pieces > 1: print(' -> Pieces:      ', pieces)
 	if plot: print(' -> Control point will be plotted after subdivision')
 
 	inputfile = './model/' + inputfile
@@ -110,21 +185,63 @@ def main(argv):
 
 	#start subdivision process
 	if maxstep > 0:
-		for step in range(maxstep + 1):
+		print('\n=== Subdivision starts')
+		if membudget is not None: base_memory = helper.find_peak_rss()	#: interpreter and modules
+		start_time = time.time()
+		model = mesh(inputfile, weld)
+		print_cleanup_report(model)
+		level_files = []
 
-			start_time = time.time()
+		for step, model in enumerate(subdivision_levels(model, maxstep, patch = patch)):
 
-			if step == 0: 
-				print('\n=== Subdivision starts')
-				model = mesh(inputfile)
-			else: 
-				subdivision(model)
+			#: existing nodes keep their index in subdivision, so measure before renumbering
+			if (step > 0) and (tolerance is not None):
+				displacement = helper.find_displacement(old_coor, model.give_nodes().give_coor(), norm)
+
+			#: the patch-based levels are built from the grids, not from the renumbered mesh
+			level_coor = model.give_nodes().give_coor()
+			if reorder is not None: reorder_mesh(model, reorder)
 
 			print("--- Iteration {0}    {1:8.2e}s".format(step, time.time() - start_time))
-			view.write_VTUfile(model, outputfile + '/Step' + str(step) + '.vtu')
+			if (step > 0) and (membudget is not None):
+				print("    Peak memory predicted {0:8.2f}MB, actual {1:8.2f}MB".format( \
+					predicted_peak/1.e6, helper.find_peak_rss()/1.e6))
+			if pieces > 1:
+				level_files.append(outputfile + '/Step' + str(step) + '.pvtu')
+				view.write_PVTUfile(model, level_files[-1], pieces)
+			else:
+				level_files.append(outputfile + '/Step' + str(step) + '.vtu')
+				view.write_VTUfile(model, level_files[-1])
+
+			if (step > 0) and (tolerance is not None):
+				print("    Displacement ({0}) {1:8.2e}".format(norm, displacement))
+				if displacement < tolerance:
+					print('--- Converged below tolerance {0:8.2e} after iteration {1}'.format(tolerance, step))
+					break
+
+			#: each step gives 4 times of faces, stop before the level gets too large
+			if (step < maxstep) and (maxface is not None) and (4*model.give_model_inf()[2] > maxface):
+				print('--- Face budget of {0} reached, stop before iteration {1}'.format(maxface, step + 1))
+				break
+
+			if (step < maxstep) and (membudget is not None):
+				predicted_peak = base_memory + helper.MEMORY_HEADROOM* \
+					helper.estimate_peak_memory(model.give_model_inf(), reorder is not None)
+				if predicted_peak > membudget*1.e6:
+					print('--- Memory budget of {0}MB reached, iteration {1} is predicted to need {2:8.2f}MB'.format( \
+						membudget, step + 1, predicted_peak/1.e6))
+					break
+
+			old_coor = model.give_nodes().give_coor()	#: not modified by subdivision
+			if patch: old_coor = level_coor
+			start_time = time.time()
+
+		#: all levels as a time series
+		view.write_PVDfile(outputfile + '/Steps.pvd', level_files)
 
 	else: 
-		model = mesh(inputfile)
+		model = mesh(inputfile, weld)
+		print_cleanup_report(model)
 		print('\n=== No subdivision and original mesh will be saved')
 
 	
@@ -136,6 +253,16 @@ def main(argv):
 		view.plot_frame(model)
 		
 
+def print_cleanup_report(model):
+	"""Function to print what was merged by welding on loading, if it was switched on."""
+
+	report = model.give_cleanup_report()
+	if report is None: return
+
+	print('--- Cleanup on loading')
+	for item in sorted(report):
+		print('    {0:18s}{1:8d}'.format(item, report[item]))
+
 
 if __name__ == '__main__':
 	main(sys.argv[1:])
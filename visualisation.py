@@ -4,8 +4,7 @@
 	@author: Ge_Yin
 """
 
-from mpl_toolkits.mplot3d import axes3d
-import matplotlib.pyplot as plt
+import os, multiprocessing
 
 def write_VTUfile(mesh, file_dir, TYPE = int(9)):
 	""" This function write a vtu file.
@@ -15,25 +14,56 @@ def write_VTUfile(mesh, file_dir, TYPE = int(9)):
 		*.vtu file can be opened using paraview. The file format can be seen by this link:
 		https://www.vtk.org/wp-content/uploads/2015/04/file-formats.pdf
 
+		If the mesh was renumbered, the index of each node and face before renumbering
+		is written as point and cell data `SubdivisionIndex`, see Mesh.give_node_order.
+
 	Args:
 		mesh: Mesh object
 		file_dir: String, the directory for ouput file
 		TYPE = 9: A constant int, gives the type of a linear quad mesh"""
 
-	file = open(file_dir,'w')
-	__n_node = mesh.give_model_inf()[0]
 	__n_face = mesh.give_model_inf()[2]
+	face_list = [mesh.give_faces().give_node_list(index_face) for index_face in range(__n_face)]
+
+	write_VTUpiece(file_dir, mesh.give_nodes().give_coor(), face_list, TYPE, \
+		mesh.give_node_order(), mesh.give_face_order())
+
+
+def write_VTUpiece(file_dir, coor, face_list, TYPE = int(9), node_order = None, face_order = None):
+	""" This function write a vtu file from lists of coordinates and faces.
+
+	Args:
+		file_dir: String, the directory for ouput file
+		coor: list of coordinates [(x1,y1,z1),...]
+		face_list: list of nodes on faces [(x0,x1,x2,x3),...]
+		TYPE = 9: A constant int, gives the type of a linear quad mesh
+		node_order, face_order: lists of int, if given written as point and cell data 
+			`SubdivisionIndex`"""
+
+	file = open(file_dir,'w')
+	__n_node = len(coor)
+	__n_face = len(face_list)
 
 	file.write('<?xml version=\"3.0\"?>\n')
 	file.write("<VTKFile type=\"UnstructuredGrid\" byte_order=\"LittleEndian\">\n")
 	file.write('  <UnstructuredGrid>\n')
 	file.write('    <Piece NumberOfPoints=\"'+ str(__n_node) + '\"  NumberOfCells=\"' + str(__n_face) + '\">\n')
+	if node_order is not None:
+		file.write('      <PointData Scalars=\"SubdivisionIndex\">\n')
+		file.write('        <DataArray type=\"Int64\" NumberOfComponents=\"1\" Name=\"SubdivisionIndex\" format=\"ascii\">\n')
+		for index_node in range(__n_node): file.write(str(node_order[index_node]) + '\n')
+		file.write('        </DataArray>\n      </PointData>\n')
+	if face_order is not None:
+		file.write('      <CellData Scalars=\"SubdivisionIndex\">\n')
+		file.write('        <DataArray type=\"Int64\" NumberOfComponents=\"1\" Name=\"SubdivisionIndex\" format=\"ascii\">\n')
+		for index_face in range(__n_face): file.write(str(face_order[index_face]) + '\n')
+		file.write('        </DataArray>\n      </CellData>\n')
 	file.write('      <Points>\n')
 	file.write('        <DataArray type=\"Float64\" NumberOfComponents=\"3\" Name=\"Coordinates\" format=\"ascii\">\n')
 	for index_node in range(__n_node):
-		x = mesh.give_nodes().give_coor()[index_node][0]
-		y = mesh.give_nodes().give_coor()[index_node][1]
-		z = mesh.give_nodes().give_coor()[index_node][2]
+		x = coor[index_node][0]
+		y = coor[index_node][1]
+		z = coor[index_node][2]
 		file.write(str(x) + ' ' + str(y) + ' ' + str(z) + '\n')
 		
 	file.write('        </DataArray>\n      </Points>\n')
@@ -44,7 +74,7 @@ def write_VTUfile(mesh, file_dir, TYPE = int(9)):
 	for index_face in range(__n_face):
 		string = ''
 		for index_vertex in range(4):
-			string += (str(mesh.give_faces().give_node_list(index_face)[index_vertex])) + ' '
+			string += (str(face_list[index_face][index_vertex])) + ' '
 		file.write(string + '\n')
 	
 	file.write('        </DataArray>\n')
@@ -66,6 +96,110 @@ def write_VTUfile(mesh, file_dir, TYPE = int(9)):
 	file.close()
 
 
+def write_PVTUfile(mesh, file_dir, n_piece, n_process = None, TYPE = int(9)):
+	""" This function write a mesh as `n_piece` vtu files and a pvtu file listing them.
+
+	Note:
+		Faces are split into `n_piece` consecutive blocks, each piece holds its block 
+		and the nodes used by it, so nodes on the border of two pieces are written 
+		in both. The pieces are written at the same time by `n_process` processes.
+		Opening the *.pvtu file in paraview shows all pieces as one dataset.
+
+	Args:
+		mesh: Mesh object
+		file_dir: String, the directory for ouput file ending with `.pvtu`, pieces are 
+			written next to it as <name>_<piece>.vtu; the index of nodes and faces before 
+		renumbering is written as in write_VTUfile
+		n_piece: int, the number of pieces
+		n_process: int, the number of processes, defaultly one per piece up to the 
+			number of CPUs
+		TYPE = 9: A constant int, gives the type of a linear quad mesh"""
+
+	__n_face = mesh.give_model_inf()[2]
+	coor = mesh.give_nodes().give_coor()
+	node_order = mesh.give_node_order()
+	face_order = mesh.give_face_order()
+	if file_dir.endswith('.pvtu'): file_base = file_dir[:-5]
+	else: file_base = file_dir
+
+	jobs = []
+	for index_piece in range(n_piece):
+		local_index = {}
+		local_coor = []
+		local_face_list = []
+		local_node_order = None if node_order is None else []
+		first_face, end_face = (index_piece*__n_face//n_piece, (index_piece + 1)*__n_face//n_piece)
+		for index_face in range(first_face, end_face):
+			local_face = []
+			for node in mesh.give_faces().give_node_list(index_face):
+				if node not in local_index:
+					local_index[node] = len(local_coor)
+					local_coor.append(coor[node])
+					if node_order is not None: local_node_order.append(node_order[node])
+				local_face.append(local_index[node])
+			local_face_list.append(local_face)
+		local_face_order = None if face_order is None else face_order[first_face:end_face]
+		jobs.append((file_base + '_' + str(index_piece) + '.vtu', local_coor, local_face_list, TYPE, \
+			local_node_order, local_face_order))
+
+	if n_process is None: n_process = min(n_piece, multiprocessing.cpu_count())
+	if n_process > 1:
+		pool = multiprocessing.Pool(n_process)
+		pool.starmap(write_VTUpiece, jobs)
+		pool.close()
+		pool.join()
+	else:
+		for job in jobs: write_VTUpiece(*job)
+
+	file = open(file_dir, 'w')
+	file.write('<?xml version=\"1.0\"?>\n')
+	file.write('<VTKFile type=\"PUnstructuredGrid\" version=\"0.1\" byte_order=\"LittleEndian\">\n')
+	file.write('  <PUnstructuredGrid GhostLevel=\"0\">\n')
+	if node_order is not None:
+		file.write('    <PPointData Scalars=\"SubdivisionIndex\">\n')
+		file.write('      <PDataArray type=\"Int64\" NumberOfComponents=\"1\" Name=\"SubdivisionIndex\"/>\n')
+		file.write('    </PPointData>\n')
+	if face_order is not None:
+		file.write('    <PCellData Scalars=\"SubdivisionIndex\">\n')
+		file.write('      <PDataArray type=\"Int64\" NumberOfComponents=\"1\" Name=\"SubdivisionIndex\"/>\n')
+		file.write('    </PCellData>\n')
+	file.write('    <PPoints>\n')
+	file.write('      <PDataArray type=\"Float64\" NumberOfComponents=\"3\" Name=\"Coordinates\"/>\n')
+	file.write('    </PPoints>\n')
+	file.write('    <PCells>\n')
+	file.write('      <PDataArray type=\"Int32\" NumberOfComponents=\"1\" Name=\"connectivity\"/>\n')
+	file.write('      <PDataArray type=\"Int32\" NumberOfComponents=\"1\" Name=\"offsets\"/>\n')
+	file.write('      <PDataArray type=\"Int8\" NumberOfComponents=\"1\" Name=\"types\"/>\n')
+	file.write('    </PCells>\n')
+	for job in jobs:
+		file.write('    <Piece Source=\"' + os.path.basename(job[0]) + '\"/>\n')
+	file.write('  </PUnstructuredGrid>\n')
+	file.write('</VTKFile>\n')
+	file.close()
+
+
+def write_PVDfile(file_dir, level_files):
+	""" This function write a pvd file, which lists the files of all levels as a time series.
+
+	Note:
+		Opening the *.pvd file in paraview shows level k as time step k.
+
+	Args:
+		file_dir: String, the directory for ouput file ending with `.pvd`
+		level_files: list of String, the *.vtu or *.pvtu file of each level"""
+
+	file = open(file_dir, 'w')
+	file.write('<?xml version=\"1.0\"?>\n')
+	file.write('<VTKFile type=\"Collection\" version=\"0.1\" byte_order=\"LittleEndian\">\n')
+	file.write('  <Collection>\n')
+	for step in range(len(level_files)):
+		level_file = os.path.relpath(level_files[step], os.path.dirname(os.path.abspath(file_dir)))
+		file.write('    <DataSet timestep=\"' + str(step) + '\" group=\"\" part=\"0\" file=\"' + level_file + '\"/>\n')
+	file.write('  </Collection>\n')
+	file.write('</VTKFile>\n')
+	file.close()
+
+
 def plot_frame(mesh):
 	"""The function uses seperate window to show control points and wireframe.
 	
@@ -75,6 +209,10 @@ def plot_frame(mesh):
 
 	Args:
 		mesh: Mesh object"""
+
+	#: imported here so that writing files does not need matplotlib
+	from mpl_toolkits.mplot3d import axes3d
+	import matplotlib.pyplot as plt
 			
 	fig = plt.figure()
 	ax = fig.add_subplot(111, projection='3d')
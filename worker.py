@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""This file contains a long-running worker for subdivision jobs.
+
+Starting `python test.py` for every job re-imports the modules, re-parses the
+model and rebuilds all topology. The worker keeps each loaded mesh and the deepest
+level subdivided so far in memory, so a later job on the same model only computes
+the levels which are not there yet. Recently requested levels are kept in a cache
+of bounded size, the least recently used models and levels are dropped when there 
+are too many or the memory budget is reached, and levels beyond a limit are refused.
+
+To use:
+	`worker.py` reads jobs from stdin, `worker.py -s <port>` listens on 127.0.0.1:<port>.
+	`-l <maxlevel>`, `-b <membudget>` (MB), `-c <cachesize>` and `-k <maxmodels>` limit
+	the memory used.
+	One job is one line of JSON, e.g.
+		{"model": "3d_example.dat", "level": 3, "output": "result/Step3.vtu"}
+	where `output` is optional. Models are looked up as given, then in ``model``.
+	{"command": "clear"} empties the cache, {"command": "quit"} stops the worker.
+	Each job is answered by one line of JSON with "status" being "ok" or "error".
+
+@author: Ge_Yin
+"""
+
+import sys, getopt, time, copy, os, json
+import socketserver
+from collections import OrderedDict
+
+from geometry import Mesh as mesh
+from subdivision import subdivision
+import visualisation as view
+import helper
+
+class Worker:
+	"""Storing the cache of loaded models and their subdivided levels."""
+
+	def __init__(self, max_level = 8, membudget = None, cache_size = 4, max_models = 4):
+		"""Sets initial values.
+
+		The models map the path of a model to (modification time, level 0, deepest 
+		level number, deepest level), the deepest level is where later jobs continue. 
+		Other requested levels are kept in a cache of `cache_size` levels. Both are 
+		ordered by use, the least recently used model or level is dropped first.
+
+		Args:
+			max_level: int, jobs asking for a deeper level are refused,
+			membudget: float, MB, cached levels are dropped, and jobs refused if that 
+				is not enough, so that the memory held by the cache and predicted for 
+				the job stays within the budget, see helper.estimate_peak_memory,
+			cache_size: int, the number of requested levels kept besides the deepest,
+			max_models: int, the number of models kept."""
+
+		self.__max_level = max_level
+		self.__membudget = membudget
+		self.__cache_size = cache_size
+		self.__max_models = max_models
+		self.__models = OrderedDict()	#: model path -> (mtime, level 0, deepest level number, deepest level)
+		self.__cache = OrderedDict()	#: (model path, level) -> Mesh object
+		if membudget is not None: self.__base_memory = helper.find_peak_rss()	#: interpreter and modules
+
+	def give_level(self, model_dir, level):
+		"""Function to give a subdivided level of a model, computing only what is not cached.
+
+		Args:
+			model_dir: String, the directory of the model file,
+			level: int, the number of subdivisions.
+
+		Returns:
+			mesh: Mesh object, shared with the cache, so it should not be modified."""
+
+		if level > self.__max_level:
+			raise ValueError('Level ' + str(level) + ' is above the limit of ' + str(self.__max_level))
+
+		mtime = os.path.getmtime(model_dir)
+		if (model_dir not in self.__models) or (self.__models[model_dir][0] != mtime):
+			self.clear(model_dir)
+			base = mesh(model_dir)
+			self.__models[model_dir] = (mtime, base, 0, base)
+			while len(self.__models) > self.__max_models: self.clear(next(iter(self.__models)))
+		self.__models.move_to_end(model_dir)
+		mtime, base, deepest_level, deepest = self.__models[model_dir]
+
+		if (model_dir, level) in self.__cache:
+			self.__cache.move_to_end((model_dir, level))
+			return self.__cache[(model_dir, level)]
+
+		if self.__membudget is not None: self.free_memory(model_dir, level)
+
+		#: continue from the deepest level, or start again from level 0 below it
+		if level >= deepest_level: this_level, model = (deepest_level, deepest)
+		else: this_level, model = (0, base)
+		while this_level < level:
+			#: subdivision gives the mesh new nodes, edges and faces instead of changing
+			#  them, so a shallow copy leaves the cached level untouched
+			model = copy.copy(model)
+			subdivision(model)
+			this_level += 1
+		if level > deepest_level: self.__models[model_dir] = (mtime, base, level, model)
+
+		self.__cache[(model_dir, level)] = model
+		while len(self.__cache) > self.__cache_size: self.__cache.popitem(last = False)
+
+		return model
+
+	def give_cached_memory(self):
+		"""Function to estimate the memory held by all cached levels, see helper.estimate_memory."""
+
+		meshes = {}
+		for mtime, base, deepest_level, deepest in self.__models.values():
+			meshes[id(base)] = base
+			meshes[id(deepest)] = deepest
+		for model in self.__cache.values(): meshes[id(model)] = model
+
+		return sum(helper.estimate_memory(model.give_model_inf()) for model in meshes.values())
+
+	def free_memory(self, model_dir, level):
+		"""Function to drop cached levels until subdividing `model_dir` to `level` fits the budget.
+
+		Requested levels are dropped first, then other models, least recently used first;
+		level 0 and the deepest level of `model_dir` are kept. Raises ValueError, without
+		dropping anything, if the job does not fit even then."""
+
+		mtime, base, deepest_level, deepest = self.__models[model_dir]
+		peak = 0
+		if level > 0: peak = helper.estimate_peak_memory(helper.predict_model_inf(base.give_model_inf(), level - 1))
+
+		#: refuse before dropping anything if the job does not fit with only its own model
+		kept = helper.estimate_memory(base.give_model_inf())
+		if deepest is not base: kept += helper.estimate_memory(deepest.give_model_inf())
+		need = self.__base_memory + helper.MEMORY_HEADROOM*(kept + peak)
+		if need > self.__membudget*1.e6:
+			raise ValueError('Level ' + str(level) + ' is predicted to need ' + \
+				'{0:.2f}MB, above the budget of {1}MB'.format(need/1.e6, self.__membudget))
+
+		while self.__base_memory + helper.MEMORY_HEADROOM*(self.give_cached_memory() + peak) > self.__membudget*1.e6:
+			if self.__cache: self.__cache.popitem(last = False)
+			else: self.clear(next(iter(self.__models)))
+
+	def clear(self, model_dir = None):
+		"""Function to empty the cache, of one model if `model_dir` is given."""
+
+		if model_dir is None:
+			self.__models = OrderedDict()
+			self.__cache = OrderedDict()
+			return
+
+		self.__models.pop(model_dir, None)
+		for key in [key for key in self.__cache if key[0] == model_dir]: del self.__cache[key]
+
+	def run_job(self, job):
+		"""Function to run one job.
+
+		Args:
+			job: dict, with keys "model", "level" and optionally "output", or "command".
+
+		Returns:
+			result: dict, to be sent back as the answer of the job."""
+
+		start_time = time.time()
+
+		if job.get('command') == 'clear':
+			self.clear()
+			return {'status': 'ok', 'command': 'clear'}
+
+		model_dir = job['model']
+		if not os.path.isfile(model_dir): model_dir = './model/' + model_dir
+		level = int(job.get('level', 0))
+		if level < 0: raise ValueError('Level must not be negative')
+
+		model = self.give_level(model_dir, level)
+		compute_time = time.time() - start_time
+		if job.get('output'): view.write_VTUfile(model, job['output'])
+
+		n_node, n_edge, n_face = model.give_model_inf()
+		return {'status': 'ok', 'model': job['model'], 'level': level,
+			'nodes': n_node, 'edges': n_edge, 'faces': n_face,
+			'compute_time': compute_time, 'time': time.time() - start_time}
+
+	def answer(self, line):
+		"""Function to run the job in one line of JSON and give the answer as one line of JSON.
+
+		Returns:
+			answer: String, or None if the worker is asked to quit."""
+
+		try:
+			job = json.loads(line)
+			if job.get('command') == 'quit': return None
+			result = self.run_job(job)
+		except Exception as error:
+			result = {'status': 'error', 'message': type(error).__name__ + ': ' + str(error)}
+
+		return json.dumps(result) + '\n'
+
+
+def serve_stdin(worker):
+	"""Function to read jobs from stdin and write the answers to stdout until EOF or quit."""
+
+	for line in sys.stdin:
+		if not line.strip(): continue
+		answer = worker.answer(line)
+		if answer is None: break
+		sys.stdout.write(answer)
+		sys.stdout.flush()
+
+def serve_socket(worker, port):
+	"""Function to read jobs from connections to 127.0.0.1:`port` until one asks to quit.
+
+	Connections are served one after another, so jobs never run concurrently on the cache."""
+
+	class JobHandler(socketserver.StreamRequestHandler):
+		def handle(self):
+			for line in self.rfile:
+				line = line.decode('utf-8')
+				if not line.strip(): continue
+				answer = worker.answer(line)
+				if answer is None:
+					self.server.stop = True
+					break
+				self.wfile.write(answer.encode('utf-8'))
+				self.wfile.flush()
+
+	server = socketserver.TCPServer(('127.0.0.1', port), JobHandler)
+	server.stop = False
+	print('=== Worker listens on 127.0.0.1:' + str(port))
+	sys.stdout.flush()
+	while not server.stop:
+		server.handle_request()
+	server.server_close()
+
+
+def main(argv):
+	"""Function to start the worker
+
+	Agrs:
+		The input will be passed to main function via `argv`:
+		`-s <port>` or `--port=<port>`: listen on a local socket instead of stdin,
+		`-l <maxlevel>` or `--maxlevel=<maxlevel>`: refuse deeper levels (default 8),
+		`-b <membudget>` or `--membudget=<membudget>`: drop cached levels, or refuse the 
+			job, if the cache and the job are predicted to need more than `membudget` MB,
+		`-c <cachesize>` or `--cachesize=<cachesize>`: the number of requested levels 
+			kept besides the deepest level of each model (default 4),
+		`-k <maxmodels>` or `--maxmodels=<maxmodels>`: the number of models kept (default 4),
+		`-h` or `--help`: call help"""
+
+	port = None
+	max_level = 8
+	membudget = None
+	cache_size = 4
+	max_models = 4
+
+	try:
+		opts, args = getopt.getopt(argv, "hs:l:b:c:k:", \
+			["port=", "maxlevel=", "membudget=", "cachesize=", "maxmodels=", "help"])
+	except getopt.GetoptError:
+		print('Error: please try worker.py -s <port>')
+		print('   or: worker.py --port=<port>')
+		sys.exit(2)
+
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			print('\nworker.py (jobs from stdin) or worker.py -s <port> (jobs from socket)')
+			print('Job: {"model": "3d_example.dat", "level": 3, "output": "result/Step3.vtu"}')
+			print('To limit the memory: -l <maxlevel> -b <membudget in MB> -c <cachesize> -k <maxmodels>\n')
+			sys.exit()
+
+		elif opt in ("-s", "--port"):
+			port = int(arg)
+
+		elif opt in ("-l", "--maxlevel"):
+			max_level = int(arg)
+
+		elif opt in ("-b", "--membudget"):
+			membudget = float(arg)
+
+		elif opt in ("-c", "--cachesize"):
+			cache_size = int(arg)
+
+		elif opt in ("-k", "--maxmodels"):
+			max_models = int(arg)
+
+	worker = Worker(max_level, membudget, cache_size, max_models)
+	if port is None: serve_stdin(worker)
+	else: serve_socket(worker, port)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])